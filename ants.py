@@ -1,27 +1,34 @@
-from constants import DIRECTIONS
-from task_manager import TaskManager, Explore, TakeFood, FollowHomeTrail, FollowFoodTrail, DropFood
+from task_manager import TaskManager, task_table, transition_table, Explore, TakeFood, FollowHomeTrail, FollowFoodTrail, DropFood
 from task_manager import GuardNest, ReturnHome
 from task_manager import ProduceAnts, FindFood
 from display import Entity
-from random import choice, randint
+from sensing import FOOD, OWN_HOME, OBSTACLE, OCCUPIED
 
 class Ant(Entity):
 	"""
 	A virtual base class for Ants
+	The tasks of every type of ant are shared by all its ants
 	"""
+	__slots__ = ("nest", "id", "direction", "index", "food", "health",
+		"food_scent_strength", "home_scent_strength", "task_manager", "sense")
+	tasks = {}
+	transitions = transition_table(tasks)
+
 	def __init__(self, world, image, direction, location, nest):
 		super(Ant, self).__init__(world, location, (1,1), image)
 		self.world = world
 		self.image = image
 		self.nest = nest
-		self.direction = direction
-		self.location = location
+		self.id = -1
+		self.direction = direction % 8
+		self.index = world.index(location)
+		self.location = self.here().location
 		self.food = 0
 		self.health = 1
 		self.food_scent_strength = 0
 		self.home_scent_strength = 0
 
-		self.task_manager = TaskManager()
+		self.task_manager = TaskManager(self, self.tasks, self.transitions)
 
 	def get_location(self):
 		return self.location
@@ -31,9 +38,14 @@ class Ant(Entity):
 		Returns location of neighbouring cell in a direction 
 		relative to the ant direction
 		"""
-		x, y = self.location
-		dx, dy = DIRECTIONS[(self.direction + direction)%8]
-		return (x+dx)%self.world.width, (y+dy)%self.world.height
+		return self.neighbour_cell(direction).location
+
+	def neighbour_cell(self, direction):
+		"""
+		Returns the neighbouring cell in a direction
+		relative to the ant direction
+		"""
+		return self.here().nearby()[(self.direction + direction)%8]
 
 	def move(self):
 		"""
@@ -43,43 +55,45 @@ class Ant(Entity):
 		remove the ant from its old cell, and
 		update the current cell ant with itself
 		"""
-		new_location = self.neighbour(0)		
-		new_cell = self.world[new_location]
+		old_cell = self.here()
+		new_cell = self.ahead()
 		if new_cell.is_obstacle() or new_cell.has_ant() or new_cell.is_food(self.get_nest_id()):
-			self.turn(choice([-1, 1]))
+			self.turn(self.world.rng.choice([-1, 1]))
 		else:
-			self.location = new_location
-			self.behind().ant = None
-			if not self.behind().is_obstacle():
-				self.behind().add_home_scent(self.home_scent_strength, self.get_nest_id()).add_food_scent(self.food_scent_strength, self.get_nest_id())
-			for cell in self.here().nearby():
-				cell.add_home_scent(self.home_scent_strength/1., self.get_nest_id()).add_food_scent(self.food_scent_strength/1., self.get_nest_id())
-			self.here().ant = self
+			self.world.mark_dirty(old_cell.location)
+			self.world.mark_dirty(new_cell.location)
+			self.index = new_cell.index
+			self.location = new_cell.location
+			self.world.spatial.update(self)
+			self.world.occupancy[old_cell.index] = -1
+			scent = self.world.scent
+			nest_id = self.get_nest_id()
+			x, y = old_cell.location
+			if not old_cell.is_obstacle():
+				scent.add_home_scent(x, y, self.home_scent_strength, nest_id).add_food_scent(x, y, self.food_scent_strength, nest_id)
+			x, y = self.location
+			scent.spread_scent(x, y, self.home_scent_strength/1., self.food_scent_strength/1., nest_id)
+			self.world.occupancy[new_cell.index] = self.id
 		return self
 
+	## Turns and moves, moves randomly if there is no turn
+	# @param turn The turn (see turn), or None
+	def walk(self, turn):
+		if turn is None:
+			self.random_move()
+		else:
+			self.turn(turn)
+			self.move()
+
 	def random_move(self):
 		"""
 		Ant makes a move forward or turns randomly
 		"""
-		if randint(1,8) == 1:
-			self.turn( choice([-1, 1]) )
+		if self.world.rng.randint(1,8) == 1:
+			self.turn( self.world.rng.choice([-1, 1]) )
 		else:
 			self.move()
 
-	def reduce_home_scent_strength(self, amt=1):
-		"""
-		Reduce home scent by 'amt'
-		"""
-		self.home_scent_strength = max(0, self.home_scent_strength*.98)
-		return self
-
-	def reduce_food_scent_strength(self, amt=1):
-		"""
-		Reduce food scent by 'amt'
-		"""
-		self.food_scent_strength = max(0, self.food_scent_strength*.98)
-		return self
-
 	def turn(self, n):
 		"""
 		Changes direction n times
@@ -90,11 +104,16 @@ class Ant(Entity):
 		"""
 		Render itself
 		"""
+		super(Ant, self).render(self.patch())
+
+	def patch(self):
+		"""
+		Returns the index of the part of the image it is drawn with
+		"""
 		if self.has_food():
-			super(Ant, self).render(8)
-		else:
-			# super(Ant, self).render(self.direction)
-			super(Ant, self).render(self.get_nest_id()*7)
+			return 8
+		# return self.direction
+		return self.get_nest_id()*7
 
 	def get_nest_id(self):
 		"""
@@ -106,47 +125,77 @@ class Ant(Entity):
 		"""
 		The cell it is standing on
 		"""
-		return self.world[self.location]
+		return self.world.cells[self.index]
 
 	def behind(self):
 		"""
 		The cell just behind
 		"""
-		return self.world[self.neighbour(4)]
+		return self.neighbour_cell(4)
 
 	def ahead(self):
 		"""
 		The cell just ahead
 		"""
-		return self.world[self.neighbour(0)]
+		return self.neighbour_cell(0)
 
 	def ahead_left(self):
 		"""
 		The cell just ahead-left
 		"""
-		return self.world[self.neighbour(-1)]
+		return self.neighbour_cell(-1)
 
 	def ahead_right(self):
 		"""
 		The cell just ahead-right
 		"""
-		return self.world[self.neighbour(1)]
+		return self.neighbour_cell(1)
+
+	## Returns what the ant sensed around it at the start of the tick
+	# (see sensing.py), indexed by the direction relative to the ant
+	# direction (0 is ahead, -1 ahead-left)
+	# @param feature FOOD, OWN_HOME, OBSTACLE or OCCUPIED
+	def sensed(self, feature):
+		row = self.world.senses.cells[self.sense, :, feature].tolist()
+		return row[self.direction:] + row[:self.direction]
+
+	## Returns what the ant sensed just ahead of it
+	# @param feature FOOD, OWN_HOME, OBSTACLE or OCCUPIED
+	def sensed_ahead(self, feature):
+		return self.world.senses.cells.item(self.sense, self.direction, feature)
+
+	## Returns the scents of the colony the ant sensed around it,
+	# indexed like Ant.sensed
+	# @param scents The home_scent or food_scent array of the Senses
+	def sensed_scent(self, scents):
+		row = scents[self.sense].tolist()
+		return row[self.direction:] + row[:self.direction]
+
+	def sensed_home_scent(self):
+		return self.sensed_scent(self.world.senses.home_scent)
+
+	def sensed_food_scent(self):
+		return self.sensed_scent(self.world.senses.food_scent)
+
+	def in_own_nest(self):
+		"""
+		Whether the ant stood in its own nest at the start of the tick
+		"""
+		return self.world.senses.at_home.item(self.sense)
 
 	def locate_food_nearby(self):
 		"""
 		Locate all sources nearby and return any one randomly
 		return None if no food source is found
 		"""
-		directions = []
-		if self.ahead().is_food(self.get_nest_id):
-			directions.append(0)
+		food = self.sensed(FOOD)
+		if food[0]:
+			directions = [0]
 		else:
-			for i in xrange(1, 8):
-				if self.world[self.neighbour(i)].is_food(self.get_nest_id()):
-					directions.append(i) 
+			directions = [i for i in xrange(1, 8) if food[i]]
 
 		if directions:
-			return choice(directions)
+			return self.world.rng.choice(directions)
 		else:
 			return None
 
@@ -160,16 +209,14 @@ class Ant(Entity):
 		Locate home cell nearby and return any one randomly
 		return None if not found
 		"""
-		directions = []
-		if self.ahead().is_own_home(self.get_nest_id()):
-			directions.append(0)
+		home = self.sensed(OWN_HOME)
+		if home[0]:
+			directions = [0]
 		else:
-			for i in xrange(1, 8):
-				if self.world[self.neighbour(i)].is_own_home(self.get_nest_id()):
-					directions.append(i) 
+			directions = [i for i in xrange(1, 8) if home[i]]
 
 		if directions:
-			return choice(directions)
+			return self.world.rng.choice(directions)
 		else:
 			return None
 
@@ -179,17 +226,18 @@ class Ant(Entity):
 		return one random direction
 		return None if not found
 		"""
+		scents = self.sensed_home_scent()
 		directions = []
-		if self.ahead().get_home_scent(self.get_nest_id()) > 0:
+		if scents[0] > 0:
 			directions.append(0)
 		else:
 			for i in xrange(-2, 3):
-				if self.world[self.neighbour(i)].get_home_scent(self.get_nest_id()) > 0:
+				if scents[i] > 0:
 					for x in xrange(1,11-5*abs(i)):
 						directions.append(i) 
 
 		if directions:
-			return choice(directions)
+			return self.world.rng.choice(directions)
 		else:
 			return None
 
@@ -199,16 +247,18 @@ class Ant(Entity):
 		return the direction with the strongest scent
 		return None if not found
 		"""
+		scents = self.sensed_home_scent()
+		occupied = self.sensed(OCCUPIED)
+		obstacle = self.sensed(OBSTACLE)
 		best_direction = 0
 		best_direction_scent = 0
 		for i in [0, -1, 1, -1, 2]:
-			cell = self.world[self.neighbour(i)]
-			if cell.has_ant() or cell.is_obstacle():
+			if occupied[i] or obstacle[i]:
 				continue
 			I = max(1, abs(i))
-			if cell.get_home_scent(self.get_nest_id())*1./I > best_direction_scent:
+			if scents[i]*1./I > best_direction_scent:
 				best_direction = i
-				best_direction_scent = cell.get_home_scent(self.get_nest_id())
+				best_direction_scent = scents[i]
 		return best_direction if best_direction_scent > .3 else None
 
 	def drop_food(self):
@@ -216,17 +266,27 @@ class Ant(Entity):
 		Set food to zero
 		Update the food values of the home cell it reached
 		"""
-		self.here().food += self.food
-		self.food = 0
+		self.here().add_food(self.food)
+		self.carry(0)
 
 	
 	## carry half the food and
 	# increase health by half the amount
 	# @param amt The amount of food
 	def take_food(self, amt):
-		self.food = amt*.5
+		self.world.mark_dirty(self.location)
+		self.carry(amt*.5)
 		self.health += amt*.5
 
+	## Sets the food carried (and tells the metrics of the world, if
+	# some are attached)
+	# @param food The amount of food
+	def carry(self, food):
+		metrics = self.world.metrics
+		if metrics is not None:
+			metrics.food_carried(self.get_nest_id(), food - self.food)
+		self.food = food
+
 	def has_food(self):
 		"""
 		Checks if the ant has food_scent
@@ -241,8 +301,12 @@ class Ant(Entity):
 
 	## Reduces the health of the ant
 	# @param amt The amount of health to reduce
+	# The ant is queued for removal when its health drops below zero
 	def reduce_health(self, amt):
-		self.health -= amt
+		health = self.health
+		self.health = health - amt
+		if health >= 0 and health - amt < 0:
+			self.world.lifecycle.queue_death(self)
 
 	def is_dead(self):
 		return True if self.health<0 else False
@@ -261,6 +325,10 @@ class WorkerAnt(Ant):
 	"""
 	Ants that explores for foodsource and collects food
 	"""
+	__slots__ = ()
+	tasks = task_table(Explore, TakeFood, DropFood, FollowFoodTrail, FollowHomeTrail)
+	transitions = transition_table(tasks)
+
 	def __init__(self, world, image, direction, location, nest):
 		"""
 		Tasks assigned:
@@ -273,11 +341,6 @@ class WorkerAnt(Ant):
 			- Explore
 		"""
 		Ant.__init__(self, world, image, direction, location, nest)
-		self.task_manager.add_task(Explore(self))
-		self.task_manager.add_task(TakeFood(self))
-		self.task_manager.add_task(DropFood(self))
-		self.task_manager.add_task(FollowFoodTrail(self))
-		self.task_manager.add_task(FollowHomeTrail(self))
 		self.task_manager.set_active_task("explore")
 
 	def locate_food_scent_nearby(self):
@@ -286,17 +349,18 @@ class WorkerAnt(Ant):
 		return one random direction
 		return None if not found
 		"""
+		scents = self.sensed_food_scent()
 		directions = []
-		if self.ahead().get_food_scent(self.get_nest_id()) > 0:
+		if scents[0] > 0:
 			directions.append(0)
 		else:
 			for i in xrange(-2, 3):
-				if self.world[self.neighbour(i)].get_food_scent(self.get_nest_id()) > 0:
+				if scents[i] > 0:
 					for x in xrange(1,11-5*abs(i)):
 						directions.append(i) 
 
 		if directions:
-			return choice(directions)
+			return self.world.rng.choice(directions)
 		else:
 			return None
 
@@ -306,16 +370,18 @@ class WorkerAnt(Ant):
 		return the direction with the strongest scent
 		return None if not found
 		"""
+		scents = self.sensed_food_scent()
+		occupied = self.sensed(OCCUPIED)
+		obstacle = self.sensed(OBSTACLE)
 		best_direction = 0
 		best_direction_scent = 0
 		for i in [0, -1, 1, -1, 2]:
-			cell = self.world[self.neighbour(i)]
-			if cell.has_ant() or cell.is_obstacle():
+			if occupied[i] or obstacle[i]:
 				continue
 			I = max(1, abs(i))
-			if cell.get_food_scent(self.get_nest_id())*1./I > best_direction_scent:
+			if scents[i]*1./I > best_direction_scent:
 				best_direction = i
-				best_direction_scent = cell.get_food_scent(self.get_nest_id())
+				best_direction_scent = scents[i]
 		return best_direction
 
 
@@ -324,6 +390,10 @@ class QueenAnt(Ant):
 	"""
 	Ants that produces offsprings and populates the colony
 	"""
+	__slots__ = ()
+	tasks = task_table(ProduceAnts, FindFood)
+	transitions = transition_table(tasks)
+
 	def __init__(self, world, image, direction, location, nest):
 		"""
 		Tasks assigned:
@@ -333,14 +403,16 @@ class QueenAnt(Ant):
 			- Find Food
 		"""
 		Ant.__init__(self, world, image, direction, location, nest)
-		self.task_manager.add_task(ProduceAnts(self))
-		self.task_manager.add_task(FindFood(self))
 		self.task_manager.set_active_task("produce ants")
 		self.health = 2
 
 
 class SoldierAnt(Ant):
 	"""Ants that produces offsprings and populates the colony"""
+	__slots__ = ()
+	tasks = task_table(GuardNest, ReturnHome)
+	transitions = transition_table(tasks)
+
 	def __init__(self, world, image, direction, location, nest):
 		"""
 		Tasks assigned:
@@ -350,17 +422,19 @@ class SoldierAnt(Ant):
 			- Guard nest
 		"""
 		Ant.__init__(self, world, image, direction, location, nest)
-		self.task_manager.add_task(GuardNest(self))
-		self.task_manager.add_task(ReturnHome(self))
 		self.task_manager.set_active_task("guard nest")
 
 	def get_enemy_ant_nearby(self):
 		"""
-		Returns one enemy ant nearby at random
+		Returns the first enemy ant on the neighbouring cells (in the order
+		of DIRECTIONS), None if there is none
 		"""
-		for cell in self.here().nearby():
-			if cell.has_ant() and self.is_enemy(cell.ant):
-				return cell.ant
+		enemies = self.world.spatial.enemies_within(self.index, self.get_nest_id(), 1)
+		if enemies:
+			for index in self.world.neighbours_of(self.index):
+				for ant in enemies:
+					if ant.index == index:
+						return ant
 		return None
 
 	def attack(self, ant):
@@ -0,0 +1,45 @@
+"""
+Benchmarks of every Task.perform_task
+"""
+from common import make_world, measure
+from task_manager import Task
+
+def task_types():
+	"""
+	Returns all Task subclasses
+	"""
+	types = []
+	pending = [Task]
+	while pending:
+		for subclass in pending.pop().__subclasses__():
+			types.append(subclass)
+			pending.append(subclass)
+	return types
+
+## Times each task performed once by every ant able to perform it
+def bench_tasks(width, height, ants, options):
+	world = make_world(width, height, ants, options.seed, population=options.population, rng=options.rng)
+	for i in xrange(options.warmup):
+		world.advance()
+
+	results = {}
+	for task_type in task_types():
+		# the tasks decide from the senses of the ants (see World.sense_ants)
+		world.sense_ants()
+		tasks = []
+		for ant in world.ants.values():
+			for task in ant.task_manager.tasks.values():
+				if type(task) is task_type:
+					tasks.append((task, ant))
+		if not tasks:
+			continue
+
+		def perform():
+			for task, ant in tasks:
+				task.perform_task(ant)
+		results["%s.perform_task" % task_type.__name__] = measure(perform, options.repeat)
+	return results
+
+BENCHMARKS = {
+	"tasks": bench_tasks,
+}
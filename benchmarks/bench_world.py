@@ -0,0 +1,96 @@
+"""
+Benchmarks of the world: construction, advancing, evaporation, rendering,
+the memory used by its entities and the queries of its spatial index
+"""
+from timeit import default_timer
+from common import make_world, measure
+from chunks import object_size
+from world import World, Nest
+
+## Times the construction of an empty world and of a nest with the
+# default mix of ants
+def bench_construction(width, height, ants, options):
+	results = {}
+	results["World.__init__"] = measure(lambda: make_world(width, height, 0, options.seed, population=options.population, rng=options.rng), options.repeat)
+
+	world = make_world(width, height, 0, options.seed, population=options.population, rng=options.rng)
+	size = [world.settings["home_size"]]*2
+	results["Nest.__init__"] = measure(lambda: Nest(world, 0, size, (1, 1), World.get_ant_count(world)), options.repeat)
+	return results
+
+## Times World.advance and World.evaporate_scent
+def bench_advance(width, height, ants, options):
+	world = make_world(width, height, ants, options.seed, population=options.population, rng=options.rng, tiles=options.tiles, scent_decay=options.scent_decay, navigation=options.navigation, step_tiles=options.step_tiles)
+	for i in xrange(options.warmup):
+		world.advance()
+	return {
+		"World.advance": measure(world.advance, options.repeat),
+		"World.evaporate_scent": measure(world.evaporate_scent, options.repeat),
+	}
+
+## Times World.render on an offscreen surface, both a full frame and
+# the incremental frame drawn after every tick
+def bench_render(width, height, ants, options):
+	world = make_world(width, height, ants, options.seed, render=True, population=options.population, rng=options.rng)
+	world.render()
+
+	def render_full():
+		world.full_redraw = True
+		world.render()
+
+	incremental = []
+	for i in xrange(options.repeat):
+		world.advance()
+		start = default_timer()
+		world.render()
+		incremental.append(default_timer() - start)
+
+	return {
+		"World.render (full)": measure(render_full, options.repeat),
+		"World.render (incremental)": incremental,
+	}
+
+## Measures the mean memory used by an ant (with its task manager, the
+# tasks are shared) and by a cell, after a few ticks
+def bench_memory(width, height, ants, options):
+	world = make_world(width, height, ants, options.seed, population=options.population, rng=options.rng)
+	for i in xrange(options.warmup):
+		world.advance()
+	cells = list(world.cells)
+	results = {"memory per cell": sum(object_size(cell) for cell in cells)*1./len(cells)}
+	if world.ants:
+		results["memory per ant"] = sum(object_size(ant) + object_size(ant.task_manager) for ant in world.ants.values())*1./len(world.ants)
+	return results
+
+## Times the queries of the spatial index for every ant: the enemies on
+# the neighbouring cells, within 8 cells and the own ants in its region
+def bench_neighbours(width, height, ants, options):
+	world = make_world(width, height, ants, options.seed, population=options.population, rng=options.rng)
+	for i in xrange(options.warmup):
+		world.advance()
+	spatial = world.spatial
+	ants = [(ant.index, ant.get_nest_id()) for ant in world.ants.values()]
+
+	def enemies_within(radius):
+		def query():
+			for index, nest_id in ants:
+				spatial.enemies_within(index, nest_id, radius)
+		return query
+
+	def count_in_region():
+		for index, nest_id in ants:
+			spatial.count_in_region(nest_id, index)
+
+	return {
+		"SpatialIndex.enemies_within (1)": measure(enemies_within(1), options.repeat),
+		"SpatialIndex.enemies_within (8)": measure(enemies_within(8), options.repeat),
+		"SpatialIndex.count_in_region": measure(count_in_region, options.repeat),
+	}
+
+BENCHMARKS = {
+	"construction": bench_construction,
+	"advance": bench_advance,
+	"render": bench_render,
+	"memory": bench_memory,
+	"neighbours": bench_neighbours,
+}
@@ -0,0 +1,91 @@
+"""
+Helpers shared by the benchmarks
+"""
+import os
+import sys
+from timeit import default_timer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy
+from pygame import image
+from constants import SETTINGS
+from world import World
+from ants import WorkerAnt, SoldierAnt, QueenAnt
+
+IMAGES = ("ant", "cell")
+
+class BenchWorld(World):
+	"""
+	World whose nests start empty, the ants are scattered by scatter_ants
+	"""
+	def get_ant_count(self):
+		return {}
+
+def load_images():
+	"""
+	Loads the images needed to render offscreen
+	"""
+	return dict((name, image.load(os.path.join(ROOT, "images", name + ".png"))) for name in IMAGES)
+
+## Builds a world for benchmarking
+# @param width, height The size of the world
+# @param ants The number of ants to scatter over the world
+# @param seed The random seed
+# @param render Whether the world renders to an offscreen surface
+# @param population The population setting ("objects" or "arrays")
+# @param rng The rng setting ("python" or "blocks")
+# @param tiles The number of tiles the scent is evaporated in
+# @param scent_decay The scent_decay setting ("eager" or "lazy")
+# @param navigation Whether the ants are guided by distance fields
+# @param step_tiles The number of tiles the ants are stepped in
+def make_world(width, height, ants, seed, render=False, population="objects", rng="python", tiles=1, scent_decay="eager", navigation=False, step_tiles=1):
+	settings = dict(SETTINGS)
+	settings["seed"] = seed
+	settings["rng"] = rng
+	settings["tiles"] = tiles
+	settings["scent_decay"] = scent_decay
+	settings["navigation"] = navigation
+	settings["step_tiles"] = step_tiles
+	settings["render_mode"] = "offscreen" if render else "none"
+	settings["population"] = population
+	world = BenchWorld(width, height, load_images() if render else {}, settings)
+	scatter_ants(world, ants)
+	return world
+
+## Adds ants on random free cells, mixed like the nests do
+# (1 queen and 5 soldiers in every 100 ants, the rest are workers)
+# @param world The world
+# @param count The number of ants
+def scatter_ants(world, count):
+	taken = world.obstacle_grid | (world.home_grid != -1) | (world.food_grid > 0)
+	for n, index in enumerate(world.rng.sample(numpy.flatnonzero(~taken).tolist(), count)):
+		cell = world.cells[index]
+		if n % 100 == 0:
+			ant_type = QueenAnt
+		elif n % 100 < 6:
+			ant_type = SoldierAnt
+		else:
+			ant_type = WorkerAnt
+		nest = world.nests[n % len(world.nests)]
+		ant = world.ant_class(ant_type)(world, world.images.get("ant"), world.rng.randint(0, 7), cell.location, nest)
+		world.add_ant(ant)
+	return world
+
+## Returns whether a world of this size can hold that many ants
+# (at most half of the cells may be occupied)
+def fits(width, height, ants):
+	return ants <= width*height/2
+
+## Times a function
+# @param function The function to time (called without arguments)
+# @param repeat The number of timed calls
+# Returns the list of durations in seconds
+def measure(function, repeat):
+	times = []
+	for i in xrange(repeat):
+		start = default_timer()
+		function()
+		times.append(default_timer() - start)
+	return times
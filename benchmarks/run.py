@@ -0,0 +1,130 @@
+"""
+Runs the benchmark suite of the simulation core headless with fixed seeds
+and writes the results as JSON
+
+	python benchmarks/run.py --sizes 80x60,130x70 --ants 100,1000 -o results.json
+	python benchmarks/run.py --compare results.json
+
+Benchmarks either time a function or measure the memory used by an
+entity (in bytes, see bench_world.bench_memory)
+
+With --compare, benchmarks slower (or entities larger) than in the old
+run by more than the threshold are reported and the exit status is 1
+"""
+import json
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+
+from common import fits
+import numpy
+import bench_world
+import bench_tasks
+
+BENCHMARKS = {}
+BENCHMARKS.update(bench_world.BENCHMARKS)
+BENCHMARKS.update(bench_tasks.BENCHMARKS)
+
+def parse_args():
+	parser = ArgumentParser(description="Benchmarks of the simulation core")
+	parser.add_argument("--sizes", default="80x60,130x70,250x250,500x500,1000x1000",
+		help="comma separated world sizes (WIDTHxHEIGHT)")
+	parser.add_argument("--ants", default="100,1000,10000,100000",
+		help="comma separated numbers of ants")
+	parser.add_argument("--only", default=",".join(sorted(BENCHMARKS)),
+		help="comma separated benchmark groups to run")
+	parser.add_argument("--repeat", type=int, default=5, help="timed calls per benchmark")
+	parser.add_argument("--warmup", type=int, default=3, help="ticks simulated before timing")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--population", default="objects", choices=("objects", "arrays"))
+	parser.add_argument("--rng", default="python", choices=("python", "blocks"))
+	parser.add_argument("--tiles", type=int, default=1, help="tiles the scent is evaporated in")
+	parser.add_argument("--scent-decay", default="eager", choices=("eager", "lazy"))
+	parser.add_argument("--navigation", action="store_true", help="guide the ants with distance fields")
+	parser.add_argument("--step-tiles", type=int, default=1, help="tiles the ants are stepped in (arrays population)")
+	parser.add_argument("-o", "--output", default="bench_results.json")
+	parser.add_argument("--compare", metavar="FILE", help="earlier results to compare against")
+	parser.add_argument("--threshold", type=float, default=1.25,
+		help="slowdown ratio reported as a regression")
+	return parser.parse_args()
+
+## Summarises the durations of a benchmark
+# @param times The durations, or the bytes used by an entity
+def summary(name, width, height, ants, options, times):
+	result = {
+		"name": name,
+		"width": width,
+		"height": height,
+		"ants": ants,
+		"population": options.population,
+		"rng": options.rng,
+		"tiles": options.tiles,
+		"scent_decay": options.scent_decay,
+		"navigation": options.navigation,
+		"step_tiles": options.step_tiles,
+	}
+	if isinstance(times, list):
+		result.update({"repeat": len(times), "min": min(times), "mean": sum(times)/len(times)})
+	else:
+		result["bytes"] = times
+	return result
+
+def key(result):
+	return result["name"], result["width"], result["height"], result["ants"], result["population"], result.get("rng", "python"), result.get("tiles", 1), result.get("scent_decay", "eager"), result.get("navigation", False), result.get("step_tiles", 1)
+
+def run(options):
+	sizes = [tuple(int(n) for n in size.split("x")) for size in options.sizes.split(",")]
+	counts = [int(n) for n in options.ants.split(",")]
+	results = []
+	for group in options.only.split(","):
+		for width, height in sizes:
+			for ants in counts:
+				if not fits(width, height, ants):
+					continue
+				timings = BENCHMARKS[group](width, height, ants, options)
+				for name in sorted(timings):
+					result = summary(name, width, height, ants, options, timings[name])
+					results.append(result)
+					if "bytes" in result:
+						print "%-36s %5dx%-5d %7d ants %10.1f bytes" % (name, width, height, ants, result["bytes"])
+					else:
+						print "%-36s %5dx%-5d %7d ants %10.3f ms" % (name, width, height, ants, result["min"]*1000)
+					sys.stdout.flush()
+	return results
+
+## Prints the benchmarks slower (or larger) than in the old results
+# Returns the number of regressions
+def compare(results, path, threshold):
+	with open(path) as old_file:
+		old = dict((key(result), result) for result in json.load(old_file)["results"])
+	regressions = 0
+	for result in results:
+		if key(result) in old:
+			measure = "bytes" if "bytes" in result else "min"
+			ratio = result[measure]/old[key(result)][measure]
+			if ratio > threshold:
+				regressions += 1
+				print "REGRESSION %-36s %5dx%-5d %7d ants %.2fx %s" % (key(result)[:4] + (ratio, "larger" if measure == "bytes" else "slower"))
+	return regressions
+
+def main():
+	options = parse_args()
+	results = run(options)
+	report = {
+		"meta": {
+			"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+			"python": platform.python_version(),
+			"numpy": numpy.__version__,
+			"platform": platform.platform(),
+			"options": vars(options),
+		},
+		"results": results,
+	}
+	with open(options.output, "w") as output:
+		json.dump(report, output, indent=1, sort_keys=True)
+	if options.compare and compare(results, options.compare, options.threshold):
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
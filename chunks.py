@@ -0,0 +1,127 @@
+"""
+Chunked storage of the cells of a world
+
+The world is split into square chunks of chunk_size x chunk_size cells.
+A chunk is only created (with all its Cell objects) the first time one
+of its cells is looked up: when an ant, food, an obstacle or a nest
+appears on it, or an ant looks at it. Regions nothing ever reached have
+no Cell objects, their cells are plain grass.
+
+Only the Cell objects are created on demand: the grids of the world
+and of the scent field still take about 40 bytes for every cell with
+two nests (and the scent overlay about 10 more once it is drawn),
+whether anything reached it or not. The neighbours and regions of the cells are computed from their
+index (see World.neighbours, SpatialIndex.region), not stored.
+"""
+import sys
+from collections import OrderedDict
+
+## Returns the approximate number of bytes used by an object: itself (with
+# its slots), its attribute dictionary if it has one and the lists and
+# tuples it refers to (other values, such as the world, are not counted)
+# @param entity The object
+def object_size(entity):
+	size = sys.getsizeof(entity)
+	attributes = getattr(entity, "__dict__", None)
+	if attributes is not None:
+		size += sys.getsizeof(attributes)
+		values = attributes.values()
+	else:
+		values = []
+	for cls in type(entity).__mro__:
+		for name in cls.__dict__.get("__slots__", ()):
+			if hasattr(entity, name):
+				values.append(getattr(entity, name))
+	return size + sum(sys.getsizeof(value) for value in values if isinstance(value, (list, tuple)))
+
+class CellStore(object):
+	"""
+	The cells of a world, looked up by flat index (see World.index)
+	and created chunk by chunk on demand
+	The existing cells are also kept in a dictionary by flat index, so
+	that looking up a cell costs a single hash lookup
+	"""
+	def __init__(self, width, height, chunk_size, make_cell):
+		"""
+		"make_cell" creates the cell at a location (i, j)
+		"""
+		self.width = width
+		self.height = height
+		self.chunk_size = chunk_size
+		self.make_cell = make_cell
+		self.chunks = {}
+		self.cells = {}
+
+	## Returns the key of the chunk holding a location and the position
+	# of the location in the chunk (the cell may not exist yet)
+	# @param index The flat index of the location
+	def locate(self, index):
+		i, j = divmod(index, self.height)
+		size = self.chunk_size
+		return (i//size, j//size), i%size*size + j%size
+
+	## Returns the cell at a flat index, creating its chunk if needed
+	# @param index The flat index of the cell
+	def __getitem__(self, index):
+		try:
+			return self.cells[index]
+		except KeyError:
+			key, position = self.locate(index)
+			return self.materialise(key)[position]
+
+	## Creates the cells of a chunk
+	# @param key The (column, row) of the chunk
+	# Returns the cells of the chunk, column after column
+	# (the chunks at the right and bottom edges may be partly outside the
+	# world, their missing cells are None)
+	def materialise(self, key):
+		size = self.chunk_size
+		ci, cj = key
+		chunk = [None]*size*size
+		for i in xrange(ci*size, min((ci + 1)*size, self.width)):
+			for j in xrange(cj*size, min((cj + 1)*size, self.height)):
+				cell = chunk[i%size*size + j%size] = self.make_cell(i, j)
+				self.cells[cell.index] = cell
+		self.chunks[key] = chunk
+		return chunk
+
+	def __len__(self):
+		return self.width*self.height
+
+	def __iter__(self):
+		"""
+		Yields the existing cells, chunk by chunk
+		"""
+		for key in sorted(self.chunks):
+			for cell in self.chunks[key]:
+				if cell is not None:
+					yield cell
+
+	def memory(self):
+		"""
+		Returns the approximate number of bytes used by every chunk:
+		its list and its cells with their attributes
+		"""
+		usage = OrderedDict()
+		for key in sorted(self.chunks):
+			chunk = self.chunks[key]
+			size = sys.getsizeof(chunk)
+			for cell in chunk:
+				if cell is not None:
+					size += object_size(cell)
+			# the entries of the cells in the dictionary by flat index
+			size += sys.getsizeof(self.cells)*len(chunk)/max(1, len(self.cells))
+			usage[key] = size
+		return usage
+
+	def report(self):
+		"""
+		Describes the memory used by the chunks, one line per chunk
+		"""
+		usage = self.memory()
+		size = self.chunk_size
+		total = (-(-self.width//size))*(-(-self.height//size))
+		lines = ["%d of %d chunks of %dx%d cells, %.1f KiB" % (len(usage), total, size, size, sum(usage.values())/1024.)]
+		for (ci, cj), chunk_bytes in usage.items():
+			lines.append("  chunk %d,%d (cells %d,%d): %.1f KiB" % (ci, cj, ci*size, cj*size, chunk_bytes/1024.))
+		return "\n".join(lines)
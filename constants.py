@@ -1,7 +1,40 @@
 DIRECTIONS = ((1,0), (1,1), (0,1), (-1,1),
 	(-1,0), (-1,-1), (0,-1), (1,-1))
+SCENT_FADE = .98
+## Share of the cells of the world above which a frame is drawn whole
+# instead of cell by cell
+FULL_REDRAW_SHARE = .1
 WIDTH = 80
 HEIGHT = 60
 WHITE = (255,255,255)
 GREEN = (0,255,20)
-YELLOW = (255,255,0)
\ No newline at end of file
+YELLOW = (255,255,0)
+HOME_SCENT_COLOUR = (255,220,126)
+FOOD_SCENT_COLOUR = (255,126,126)
+NEST_COLOURS = ((255,220,126), (126,126,255), (255,126,255), (126,255,255))
+
+SETTINGS = {
+	"no_of_ants": 150,
+	"evaporation_rate": .03,
+	"diffusion_kernel": None,
+	"scent_decay": "eager",
+	"scent_compact_every": 100,
+	"home_size": 10,
+	"ant_mix": (94, 5, 1),
+	"scent_strength": 40,
+	"cell_size": 10,
+	"no_of_nests": 2,
+	"render_mode": "display",
+	"scent_overlay": "max",
+	"population": "objects",
+	"tiles": 1,
+	"step_tiles": 1,
+	"chunk_size": 16,
+	"navigation": False,
+	"region_size": 8,
+	"profile": False,
+	"profile_report_every": 0,
+	"seed": None,
+	"rng": "python",
+	"rng_block_size": 4096
+}
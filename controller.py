@@ -1,6 +1,11 @@
-from pygame import image, time, key, event, mouse
+from pygame import image, time, key, event, mouse, display, font
 from pygame.constants import *
+from threading import Thread, Condition
+from timeit import default_timer
+from constants import SETTINGS, WHITE
 from world import World
+from snapshot import save_world, load_world
+from recording import Replay
 
 class Simulation():
 	"""
@@ -10,14 +15,42 @@ class Simulation():
 		- Loads the necessary images
 		- Controls the framerate of the simulation
 	"""
-	def __init__(self):
+	def __init__(self, headless=False, settings=None, snapshot=None):
+		"""
+		In headless mode no window is opened and no images are loaded,
+		the world is only advanced (see run_headless)
+		"settings" overrides the default settings
+		"snapshot" is a file to resume the world from, its saved settings
+		are used unless overridden by "settings"
+		"""
 		self.clock = time.Clock()
 		self.framerate = 60
 		self.images = {}
+		self.ticks_per_second = 0
 
 		self.quit = False
 		self.pause = False
 
+		self.settings = dict(SETTINGS)
+		self.settings.update(settings or {})
+
+		if headless:
+			self.settings["render_mode"] = "none"
+		else:
+			self.load_images()
+
+		if snapshot:
+			overrides = dict(settings or {})
+			overrides["render_mode"] = self.settings["render_mode"]
+			self.world = load_world(snapshot, self.images, overrides)
+			self.settings = self.world.settings
+		else:
+			self.world = World(130, 70, self.images, self.settings)
+
+	def load_images(self):
+		"""
+		Loads all images of the simulation
+		"""
 		self.add_image("ant", "ant.png")
 		self.add_image("grass", "grass.png")
 		self.add_image("food", "food.png")
@@ -27,15 +60,6 @@ class Simulation():
 		self.add_image("food_scent", "food_scent.png")
 		self.add_image("cell", "cell.png")
 
-		self.settings = {
-		"no_of_ants": 150,
-		"evaporation_rate": .03,
-		"home_size": 10,
-		"cell_size": 10
-		}
-
-		self.world = World(130, 70, self.images, self.settings)
-
 	def add_image(self, name, path):
 		"""
 		Loads an image
@@ -49,6 +73,22 @@ class Simulation():
 		while self.quit is False and self.pause is False:
 			self.main_loop()
 
+	## Advances the world as fast as possible without rendering
+	# @param steps The number of ticks to simulate
+	# @param checkpoint_every Save a snapshot of the world every so many
+	# ticks (never if zero)
+	# @param checkpoint_path The file the snapshots are written to
+	# Returns the number of ticks simulated per second
+	def run_headless(self, steps, checkpoint_every=0, checkpoint_path="checkpoint.snap"):
+		start = default_timer()
+		for i in xrange(1, steps + 1):
+			self.world.advance()
+			if checkpoint_every and i % checkpoint_every == 0:
+				save_world(self.world, checkpoint_path)
+		elapsed = default_timer() - start
+		self.ticks_per_second = steps/elapsed if elapsed else float("inf")
+		return self.ticks_per_second
+
 	def main_loop(self):
 		"""
 		Updates the simulation
@@ -82,10 +122,13 @@ class Simulation():
 	def handle_general_events(self):
 		"""
 		set quit true if user clicks the close button
+		toggle the scent overlay mode if user presses S
 		"""
 		for evt in event.get():
 			if evt.type == QUIT:
 				self.quit = True
+			elif evt.type == KEYDOWN and evt.key == K_s:
+				self.world.toggle_scent_overlay()
 
 	def handle_mouse_events(self):
 		"""
@@ -100,4 +143,291 @@ class Simulation():
 			cell.make_obstacle()
 		elif pressed[2]:
 			if cell.is_obstacle():
-				cell.remove_obstacle()
\ No newline at end of file
+				cell.remove_obstacle()
+
+class Player(Simulation):
+	"""
+	Plays a recording (see recording.py) instead of simulating
+		- SPACE pauses and resumes
+		- UP and DOWN double and halve the speed
+		- LEFT and RIGHT seek 100 ticks backwards and forwards
+	"""
+	def __init__(self, path, speed=1., start=0):
+		"""
+		Plays the recording in "path" from the tick "start" on,
+		"speed" ticks per frame (less than one to slow it down)
+		"""
+		self.clock = time.Clock()
+		self.framerate = 60
+		self.images = {}
+		self.ticks_per_second = 0
+
+		self.quit = False
+		self.pause = False
+		self.paused = False
+		self.speed = speed
+		self.progress = 0.
+
+		self.load_images()
+		self.replay = Replay(path, self.images, {"render_mode": "display"})
+		self.seek(start)
+
+	## Moves the replay to a tick
+	# @param tick The tick, clamped to the recorded ones
+	def seek(self, tick):
+		self.replay.seek(tick)
+		self.world = self.replay.world
+		self.settings = self.world.settings
+		self.world.full_redraw = True
+
+	def main_loop(self):
+		"""
+		Draws the world, then applies as many recorded ticks as the
+		speed asks for
+		"""
+		self.world.render()
+		if not self.paused:
+			self.progress += self.speed
+			while self.progress >= 1:
+				self.progress -= 1
+				if not self.replay.step():
+					self.paused = True
+					self.progress = 0.
+		self.handle_events()
+		self.clock.tick(self.framerate)
+
+	def handle_mouse_events(self):
+		"""
+		The recording can not be edited
+		"""
+		pass
+
+	def handle_general_events(self):
+		"""
+		set quit true if user clicks the close button
+		toggle the scent overlay mode if user presses S
+		pause, change speed and seek with the keys above
+		"""
+		for evt in event.get():
+			if evt.type == QUIT:
+				self.quit = True
+			elif evt.type == KEYDOWN:
+				if evt.key == K_s:
+					self.world.toggle_scent_overlay()
+				elif evt.key == K_SPACE:
+					self.paused = not self.paused
+				elif evt.key == K_UP:
+					self.speed *= 2
+				elif evt.key == K_DOWN:
+					self.speed /= 2
+				elif evt.key == K_LEFT:
+					self.seek(self.replay.tick - 100)
+				elif evt.key == K_RIGHT:
+					self.seek(self.replay.tick + 100)
+
+class SimulationThread(Thread):
+	"""
+	Advances a world on a thread of its own, as fast as it can
+	The display thread only touches the world between two ticks, through
+	SimulationThread.frame, to take a Frame of the latest tick that it
+	draws while the next ticks are simulated: the ticks simulated in
+	between are never drawn
+	"""
+	def __init__(self, world, ticks_per_frame=0):
+		"""
+		At most "ticks_per_frame" ticks are simulated between two frames
+		(no limit if 0)
+		"""
+		Thread.__init__(self, name="simulation")
+		self.daemon = True
+		self.world = world
+		self.ticks_per_frame = ticks_per_frame
+		self.condition = Condition()
+		self.ticks = 0
+		self.pending = 0
+		self.busy = False
+		self.frame_requested = False
+		self.paused = False
+		self.stopped = False
+		self.failed = False
+
+	def waiting(self):
+		"""
+		Whether the next tick has to wait: a frame is being drawn, the
+		simulation is paused or the ticks of this frame are all done
+		"""
+		if self.stopped:
+			return False
+		if self.frame_requested or self.paused:
+			return True
+		return self.ticks_per_frame and self.pending >= self.ticks_per_frame
+
+	def run(self):
+		while True:
+			with self.condition:
+				while self.waiting():
+					self.condition.wait()
+				if self.stopped:
+					return
+				self.busy = True
+			try:
+				self.world.advance()
+			except:
+				self.failed = True
+				self.stopped = True
+				raise
+			finally:
+				with self.condition:
+					self.busy = False
+					self.ticks += 1
+					self.pending += 1
+					self.condition.notify_all()
+
+	## Calls a function while the world is between two ticks
+	# The simulation waits for the function to return
+	# @param function The function, copying the world or changing it
+	# Returns what the function returns
+	def frame(self, function):
+		with self.condition:
+			if self.failed:
+				raise RuntimeError("the simulation thread failed")
+			self.frame_requested = True
+			while self.busy:
+				self.condition.wait()
+			try:
+				return function()
+			finally:
+				self.pending = 0
+				self.frame_requested = False
+				self.condition.notify_all()
+
+	def stop(self):
+		"""
+		Stops the simulation after the current tick
+		"""
+		with self.condition:
+			self.stopped = True
+			self.condition.notify_all()
+		self.join()
+
+class Counters(object):
+	"""
+	The ticks and frames per second, measured every second and drawn
+	in the top left corner of the canvas
+	"""
+	def __init__(self, world):
+		font.init()
+		self.font = font.Font(None, 18)
+		self.world = world
+		self.start = default_timer()
+		self.ticks = 0
+		self.frames = 0
+		self.ticks_per_second = 0.
+		self.frames_per_second = 0.
+		## The cells beneath the counters drawn last
+		self.covered = set()
+
+	## Counts a frame
+	# @param ticks The number of ticks simulated since the previous frame
+	def count(self, ticks):
+		self.ticks += ticks
+		self.frames += 1
+		now = default_timer()
+		elapsed = now - self.start
+		if elapsed >= 1:
+			self.ticks_per_second = self.ticks/elapsed
+			self.frames_per_second = self.frames/elapsed
+			self.start = now
+			self.ticks = 0
+			self.frames = 0
+
+	def draw(self):
+		"""
+		Draws the counters over the world
+		The cells beneath are kept in "covered", to be marked dirty when
+		the next frame is taken (the world may be advancing meanwhile)
+		Returns the rect of the counters, None if there is no canvas
+		"""
+		world = self.world
+		if world.canvas is None:
+			return None
+		text = "TPS %.1f  FPS %.1f" % (self.ticks_per_second, self.frames_per_second)
+		rect = world.canvas.blit(self.font.render(text, True, (0, 0, 0), WHITE), (4, 4))
+		size = world.cell_size
+		self.covered = set((x, y)
+			for x in xrange(rect.left//size, (rect.right - 1)//size + 1)
+			for y in xrange(rect.top//size, (rect.bottom - 1)//size + 1))
+		return rect
+
+class ThreadedSimulation(Simulation):
+	"""
+	Simulates on a SimulationThread while the main thread draws the
+	latest tick at the frame rate, with the ticks and frames per second
+		- SPACE pauses and resumes the simulation
+	"""
+	def __init__(self, settings=None, snapshot=None, ticks_per_frame=0, framerate=30):
+		"""
+		"ticks_per_frame" limits the ticks simulated between two frames
+		(no limit if 0)
+		"framerate" is the number of frames drawn per second, the
+		simulation runs while the main thread waits for the next frame
+		"""
+		Simulation.__init__(self, settings=settings, snapshot=snapshot)
+		self.framerate = framerate
+		self.ticks_per_frame = ticks_per_frame
+		self.counters = Counters(self.world)
+		self.thread = None
+
+	def run(self):
+		"""
+		Starts the simulation thread and draws frames till the user quits
+		"""
+		self.thread = SimulationThread(self.world, self.ticks_per_frame)
+		self.thread.start()
+		try:
+			Simulation.run(self)
+		finally:
+			self.thread.stop()
+
+	def main_loop(self):
+		"""
+		Handles the events and takes a frame of the latest tick between
+		two ticks, then draws it and waits for the next frame while the
+		simulation goes on
+		"""
+		frame = self.thread.frame(self.capture)
+		self.draw(frame)
+		self.clock.tick(self.framerate)
+
+	def capture(self):
+		"""
+		Counts the frame, handles the events and returns a Frame of the
+		world (called between two ticks)
+		"""
+		self.counters.count(self.thread.pending)
+		self.ticks_per_second = self.counters.ticks_per_second
+		self.handle_events()
+		self.world.dirty.update(self.counters.covered)
+		return self.world.capture()
+
+	## Draws a frame of the world and the counters
+	# @param frame The Frame
+	def draw(self, frame):
+		self.world.render(frame)
+		rect = self.counters.draw()
+		if rect is not None and self.settings["render_mode"] == "display":
+			display.update(rect)
+
+	def handle_general_events(self):
+		"""
+		set quit true if user clicks the close button
+		toggle the scent overlay mode if user presses S
+		pause and resume the simulation if user presses SPACE
+		"""
+		for evt in event.get():
+			if evt.type == QUIT:
+				self.quit = True
+			elif evt.type == KEYDOWN and evt.key == K_s:
+				self.world.toggle_scent_overlay()
+			elif evt.type == KEYDOWN and evt.key == K_SPACE:
+				self.thread.paused = not self.thread.paused
@@ -2,6 +2,8 @@ class Entity(object):
 	"""
 	Base class for all drawable objects
 	"""
+	__slots__ = ("world", "location", "size", "image")
+
 	def __init__(self, world, location, size, image):
 		self.world = world
 		self.location = location
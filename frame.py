@@ -0,0 +1,40 @@
+"""
+What the renderer needs of a tick, copied out of the world
+
+A Frame is taken between two ticks (see World.capture) and holds
+	- the food, obstacle and home grids
+	- the location and image patch of every ant
+	- the visible scent levels of the whole field when it is drawn from
+	  scratch, of the cells whose level changed otherwise (see
+	  ScentOverlay)
+	- the cells marked dirty since the previous frame, and whether the
+	  whole world has to be redrawn
+so that World.render can draw it while the world goes on advancing on
+another thread (see controller.SimulationThread). Taking a frame hands
+the dirty cells over to it: the world starts collecting the next ones.
+"""
+
+class Frame(object):
+	"""
+	A copy of the drawable state of a world
+	"""
+	def __init__(self, world):
+		self.full = world.full_redraw
+		world.full_redraw = False
+		self.dirty = world.dirty
+		world.dirty = set()
+
+		self.food_grid = world.food_grid.copy()
+		self.obstacle_grid = world.obstacle_grid.copy()
+		self.home_grid = world.home_grid.copy()
+		## (image, location, patch) of every ant
+		self.ants = [(ant.image, ant.location, ant.patch()) for ant in world.ants.values()]
+
+		self.scent_mode = world.settings["scent_overlay"]
+		if self.full:
+			self.scent_levels = world.overlay.reset()
+			self.scent_cells = None
+		else:
+			self.scent_levels = None
+			## (xs, ys, levels) of the cells whose scent level changed
+			self.scent_cells = world.overlay.changes()
@@ -0,0 +1,102 @@
+import logging
+
+log = logging.getLogger("ants")
+
+class Lifecycle(object):
+	"""
+	Keeps track of the births and deaths of the ants of a world
+		- the ids of dead ants are reused for new ants
+		- ants are queued when their health drops below zero, so that
+		  removing the dead never scans all ants
+		- births and deaths are counted per nest, logged to the "ants"
+		  logger and passed on to the listeners
+	"""
+	def __init__(self, world):
+		self.world = world
+		self.next_id = 0
+		self.free_ids = []
+		self.dying = []
+		self.births = {}
+		self.deaths = {}
+		self.listeners = []
+
+	def allocate_id(self):
+		"""
+		Returns an unused ant id, reusing the ids of dead ants first
+		"""
+		if self.free_ids:
+			return self.free_ids.pop()
+		id = self.next_id
+		self.next_id += 1
+		return id
+
+	## Adds an object told about every birth and death
+	# @param listener An object with ant_born(ant) and ant_died(ant) methods
+	def add_listener(self, listener):
+		self.listeners.append(listener)
+
+	## Removes a listener added by add_listener
+	def remove_listener(self, listener):
+		self.listeners.remove(listener)
+
+	## Counts a new ant (called by World.add_ant)
+	# @param ant The ant, already in the world
+	def born(self, ant):
+		nest_id = ant.get_nest_id()
+		log.debug("An ant is born in nest #%d", nest_id)
+		self.births[nest_id] = self.births.get(nest_id, 0) + 1
+		for listener in self.listeners:
+			listener.ant_born(ant)
+
+	## Queues an ant whose health dropped below zero
+	# It is removed at the end of the tick unless it recovers first
+	# @param ant The ant
+	def queue_death(self, ant):
+		self.dying.append(ant)
+
+	def remove_dead(self):
+		"""
+		Removes the queued ants that are still dead from the world,
+		frees their cells, slots and ids
+		Returns the number of removed ants
+		"""
+		world = self.world
+		dying, self.dying = self.dying, []
+		removed = 0
+		for ant in dying:
+			# queued twice or recovered since
+			if world.ants.get(ant.id) is not ant or not ant.is_dead():
+				continue
+			nest_id = ant.get_nest_id()
+			log.debug("An ant from nest #%d is dead", nest_id)
+			self.deaths[nest_id] = self.deaths.get(nest_id, 0) + 1
+			for listener in self.listeners:
+				listener.ant_died(ant)
+
+			if world.occupancy[ant.index] == ant.id:
+				world.occupancy[ant.index] = -1
+			world.mark_dirty(ant.get_location())
+			del world.ants[ant.id]
+			if world.population is not None:
+				world.population.release(ant.slot)
+			self.free_ids.append(ant.id)
+			removed += 1
+		return removed
+
+	def state(self):
+		"""
+		Returns the ids and counters, to be saved in a snapshot
+		"""
+		return {
+			"next_id": self.next_id,
+			"free_ids": self.free_ids,
+			"births": sorted(self.births.items()),
+			"deaths": sorted(self.deaths.items()),
+		}
+
+	## Restores the ids and counters saved by state
+	def set_state(self, state):
+		self.next_id = state["next_id"]
+		self.free_ids = list(state["free_ids"])
+		self.births = dict(state["births"])
+		self.deaths = dict(state["deaths"])
@@ -1,5 +1,76 @@
-from controller import Simulation
+import logging
+from argparse import ArgumentParser
+from controller import Simulation, ThreadedSimulation, Player
+from recording import Recorder
+from metrics import Metrics, open_sink
 
 if __name__ == '__main__':
-	simulation = Simulation()
-	simulation.run()
\ No newline at end of file
+	parser = ArgumentParser(description="Ant colony simulation")
+	parser.add_argument("--headless", type=int, metavar="STEPS",
+		help="run STEPS ticks without a display and report ticks per second")
+	parser.add_argument("--profile", type=int, metavar="TICKS",
+		help="profile the simulation and print a report every TICKS ticks")
+	parser.add_argument("--seed", type=int, help="seed for a reproducible run")
+	parser.add_argument("--verbose", action="store_true",
+		help="log the births and deaths of ants (and in headless mode the memory used by the cells)")
+	parser.add_argument("--navigation", action="store_true",
+		help="guide the ants with distance fields to home and food instead of scent trails")
+	parser.add_argument("--resume", metavar="SNAPSHOT", help="resume the world saved in SNAPSHOT")
+	parser.add_argument("--checkpoint", type=int, default=0, metavar="TICKS",
+		help="in headless mode save a snapshot every TICKS ticks")
+	parser.add_argument("--checkpoint-path", default="checkpoint.snap",
+		help="file the checkpoints are written to")
+	parser.add_argument("--record", metavar="FILE", help="record the changes of every tick to FILE")
+	parser.add_argument("--keyframe-every", type=int, default=100, metavar="TICKS",
+		help="ticks between two keyframes of the recording")
+	parser.add_argument("--metrics", metavar="FILE",
+		help="write the metrics of the nests to FILE (.csv or .jsonl)")
+	parser.add_argument("--metrics-every", type=int, default=10, metavar="TICKS",
+		help="ticks between two samples of the metrics")
+	parser.add_argument("--threaded", action="store_true",
+		help="simulate on a thread of its own, drawing only the latest tick every frame")
+	parser.add_argument("--ticks-per-frame", type=int, default=0, metavar="TICKS",
+		help="with --threaded, simulate at most TICKS ticks between two frames (0 for no limit)")
+	parser.add_argument("--fps", type=int, default=30,
+		help="with --threaded, frames drawn per second (fewer frames leave more time to the simulation)")
+	parser.add_argument("--replay", metavar="FILE", help="play the recording in FILE")
+	parser.add_argument("--speed", type=float, default=1., help="ticks replayed per frame")
+	parser.add_argument("--start", type=int, default=0, metavar="TICK", help="tick the replay starts from")
+	args = parser.parse_args()
+	logging.basicConfig(format="%(message)s", level=logging.DEBUG if args.verbose else logging.WARNING)
+
+	settings = {}
+	if args.seed is not None:
+		settings["seed"] = args.seed
+	if args.navigation:
+		settings["navigation"] = True
+	if args.profile:
+		settings["profile"] = True
+		settings["profile_report_every"] = args.profile
+
+	if args.replay:
+		Player(args.replay, args.speed, args.start).run()
+	elif args.headless:
+		simulation = Simulation(headless=True, settings=settings, snapshot=args.resume)
+		recorder = Recorder(simulation.world, args.record, args.keyframe_every) if args.record else None
+		metrics = Metrics(simulation.world, every=args.metrics_every, sink=open_sink(args.metrics)) if args.metrics else None
+		ticks_per_second = simulation.run_headless(args.headless, args.checkpoint, args.checkpoint_path)
+		print "%.1f ticks per second" % ticks_per_second
+		if args.verbose:
+			print simulation.world.cells.report()
+		if recorder is not None:
+			recorder.close()
+		if metrics is not None:
+			metrics.close()
+	else:
+		if args.threaded:
+			simulation = ThreadedSimulation(settings=settings, snapshot=args.resume, ticks_per_frame=args.ticks_per_frame, framerate=args.fps)
+		else:
+			simulation = Simulation(settings=settings, snapshot=args.resume)
+		recorder = Recorder(simulation.world, args.record, args.keyframe_every) if args.record else None
+		metrics = Metrics(simulation.world, every=args.metrics_every, sink=open_sink(args.metrics)) if args.metrics else None
+		simulation.run()
+		if recorder is not None:
+			recorder.close()
+		if metrics is not None:
+			metrics.close()
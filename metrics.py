@@ -0,0 +1,252 @@
+"""
+Per nest metrics of a running world, kept in ring buffers
+
+Every sample holds, for every nest:
+	- population.<type> : the living ants of each type
+	- food_stored : the food on the cells of the nest
+	- food_carried : the food carried by its ants
+	- task.<name> : the ants performing each task
+	- home_scent, food_scent : the total scent of the colony
+and the ticks per second of the simulation (nest -1)
+"""
+import csv
+import json
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy
+
+class RingBuffer(object):
+	"""
+	The last "capacity" values of a series with their running sum
+	"""
+	def __init__(self, capacity, count=0):
+		"""
+		"count" values (zeros) are considered already appended, so that a
+		series started late lines up with the older ones
+		"""
+		self.values = numpy.zeros(capacity)
+		self.capacity = capacity
+		self.count = count
+		self.total = 0.
+
+	## Appends a value, dropping the oldest one if the buffer is full
+	def append(self, value):
+		position = self.count % self.capacity
+		if self.count >= self.capacity:
+			self.total -= self.values[position]
+		self.values[position] = value
+		self.total += value
+		self.count += 1
+
+	def __len__(self):
+		return min(self.count, self.capacity)
+
+	def __iter__(self):
+		"""
+		Yields the values from the oldest to the newest
+		"""
+		size = len(self)
+		start = (self.count - size) % self.capacity
+		for i in xrange(size):
+			yield self.values[(start + i) % self.capacity].item()
+
+	def latest(self):
+		return self.values[(self.count - 1) % self.capacity].item() if self.count else 0.
+
+	def mean(self):
+		"""
+		Mean of the values in the buffer, from the running sum
+		"""
+		return self.total/len(self) if self.count else 0.
+
+	def min(self):
+		return self.values[:len(self)].min().item() if self.count else 0.
+
+	def max(self):
+		return self.values[:len(self)].max().item() if self.count else 0.
+
+class Metrics(object):
+	"""
+	Collects the metrics of a world every few ticks
+	Attached to the world (World.metrics) it is called by World.advance
+	All values are kept up to date as the world changes, a sample never
+	looks at the ants or the cells
+		- the population, carried food and tasks are counted as a
+		  listener of the Lifecycle, then as the ants take and drop food
+		  (Ant.take_food, Ant.drop_food) and switch tasks
+		  (TaskManager.switch_task)
+		- the stored food is kept up to date by the nests
+		- the scent by the scent field (ScentField.mass)
+	"""
+	def __init__(self, world, capacity=1000, every=1, sink=None):
+		"""
+		Keeps the last "capacity" samples, taken every "every" ticks
+		Every sample is also written to "sink" (see CSVSink and JSONLSink)
+		"""
+		self.world = world
+		self.capacity = capacity
+		self.every = every
+		self.sink = sink
+		self.tick = 0
+		self.ticks = RingBuffer(capacity)
+		self.series = OrderedDict()
+		self.last_sample = default_timer()
+
+		self.population = {}
+		## nest id -> food carried by its ants
+		self.carried = {}
+		## (nest id, task name) -> ants performing the task
+		self.tasks = {}
+		for ant in world.ants.values():
+			self.ant_born(ant)
+		world.metrics = self
+		world.lifecycle.add_listener(self)
+
+	def close(self):
+		"""
+		Detaches from the world and closes the sink
+		"""
+		self.world.metrics = None
+		self.world.lifecycle.remove_listener(self)
+		if self.sink is not None:
+			self.sink.close()
+
+	def ant_born(self, ant):
+		nest_id = ant.get_nest_id()
+		key = (nest_id, type(ant).__name__)
+		self.population[key] = self.population.get(key, 0) + 1
+		self.food_carried(nest_id, ant.food)
+		key = (nest_id, ant.task_manager.active_task.name)
+		self.tasks[key] = self.tasks.get(key, 0) + 1
+
+	def ant_died(self, ant):
+		nest_id = ant.get_nest_id()
+		self.population[(nest_id, type(ant).__name__)] -= 1
+		self.food_carried(nest_id, -ant.food)
+		self.tasks[(nest_id, ant.task_manager.active_task.name)] -= 1
+
+	## Counts food taken or dropped by the ants of a nest
+	# @param nest_id The id of the nest
+	# @param amount The change of the food they carry
+	def food_carried(self, nest_id, amount):
+		self.carried[nest_id] = self.carried.get(nest_id, 0.) + amount
+
+	## Counts an ant switching tasks
+	# @param ant The ant
+	# @param old_task, new_task The tasks
+	def task_switched(self, ant, old_task, new_task):
+		nest_id = ant.get_nest_id()
+		self.tasks[(nest_id, old_task.name)] -= 1
+		key = (nest_id, new_task.name)
+		self.tasks[key] = self.tasks.get(key, 0) + 1
+
+	def sample(self):
+		"""
+		Returns the current metrics as a dictionary mapping
+		(nest id, metric name) to a value
+		"""
+		world = self.world
+		values = {}
+		home_scent, food_scent = world.scent.mass()
+		for nest_id, nest in world.nests.items():
+			values[(nest_id, "food_stored")] = nest.food
+			values[(nest_id, "food_carried")] = self.carried.get(nest_id, 0.)
+			values[(nest_id, "home_scent")] = home_scent[nest_id]
+			values[(nest_id, "food_scent")] = food_scent[nest_id]
+		for (nest_id, ant_type), count in self.population.items():
+			values[(nest_id, "population." + ant_type)] = count
+		for (nest_id, task), count in self.tasks.items():
+			values[(nest_id, "task." + task)] = count
+		return values
+
+	def record_tick(self):
+		"""
+		Counts a tick and takes a sample every "every" ticks
+		(called by World.advance)
+		"""
+		self.tick += 1
+		if self.tick % self.every:
+			return
+		now = default_timer()
+		values = self.sample()
+		values[(-1, "ticks_per_second")] = self.every/(now - self.last_sample) if now > self.last_sample else 0.
+		self.last_sample = now
+
+		for key in values:
+			if key not in self.series:
+				self.series[key] = RingBuffer(self.capacity, self.ticks.count)
+		self.ticks.append(self.tick)
+		for key, series in self.series.items():
+			series.append(values.get(key, 0))
+		if self.sink is not None:
+			self.sink.write(self.tick, values)
+
+	## Yields the (tick, value) pairs of a series still in the buffers
+	# @param nest_id The id of the nest (-1 for ticks_per_second)
+	# @param name The name of the metric
+	def history(self, nest_id, name):
+		series = self.series.get((nest_id, name))
+		if series is None:
+			return
+		for tick, value in zip(self.ticks, series):
+			yield int(tick), value
+
+	def __iter__(self):
+		"""
+		Yields the samples still in the buffers, oldest first, as
+		(tick, {(nest id, name): value}) pairs
+		"""
+		columns = [iter(series) for series in self.series.values()]
+		for tick in self.ticks:
+			yield int(tick), dict(zip(self.series.keys(), [next(column) for column in columns]))
+
+	## Rolling aggregates of a series over the samples in the buffers
+	# @param nest_id The id of the nest (-1 for ticks_per_second)
+	# @param name The name of the metric
+	# Returns the latest, mean, minimum and maximum values
+	def aggregate(self, nest_id, name):
+		series = self.series.get((nest_id, name))
+		if series is None:
+			return None
+		return {"latest": series.latest(), "mean": series.mean(), "min": series.min(), "max": series.max()}
+
+class CSVSink(object):
+	"""
+	Writes samples as CSV rows: tick, nest, metric, value
+	"""
+	def __init__(self, path):
+		self.file = open(path, "wb")
+		self.writer = csv.writer(self.file)
+		self.writer.writerow(("tick", "nest", "metric", "value"))
+
+	def write(self, tick, values):
+		self.writer.writerows((tick, nest_id, name, value) for (nest_id, name), value in sorted(values.items()))
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+class JSONLSink(object):
+	"""
+	Writes every sample as a line of JSON:
+	{"tick": ..., "nests": {nest id: {metric: value}}}
+	"""
+	def __init__(self, path):
+		self.file = open(path, "w")
+
+	def write(self, tick, values):
+		nests = {}
+		for (nest_id, name), value in values.items():
+			nests.setdefault(nest_id, {})[name] = value
+		self.file.write(json.dumps({"tick": tick, "nests": nests}, sort_keys=True) + "\n")
+		self.file.flush()
+
+	def close(self):
+		self.file.close()
+
+## Returns the sink for a file, chosen by its extension (.csv or .jsonl)
+def open_sink(path):
+	if path.endswith(".csv"):
+		return CSVSink(path)
+	return JSONLSink(path)
@@ -0,0 +1,208 @@
+"""
+Distance fields guiding the ants home and to food
+
+For every nest two fields give, for every cell, the number of moves to
+the nearest cell of the nest and to the nearest cell with food (not in
+the nest). An ant finds its way by looking up the distances of its 8
+neighbours, whatever the scent around it.
+
+The fields are built the first time they are used, then kept up to date
+as obstacles are made or removed and as food appears or runs out:
+	- a new source or a removed obstacle can only bring cells closer,
+	  the new distances spread from the changed cell
+	- a removed source or a new obstacle can only push cells further,
+	  the cells whose shortest path went through the changed cell are
+	  cleared and filled again from the cells around them
+Both spread as wavefronts over the neighbours of the cells, so an
+update only touches the cells whose distance changes.
+"""
+import numpy
+
+## Distance of the cells no source can be reached from
+UNREACHABLE = numpy.iinfo(numpy.int32).max
+## Turns relative to the direction of an ant, in order of preference
+TURNS = numpy.array([0, 1, -1, 2, -2, 3, -3, 4])
+
+class DistanceField(object):
+	"""
+	Number of moves from every cell to the nearest source cell, going
+	around the blocked cells (the grid wraps around)
+	"""
+	def __init__(self, world, blocked, sources):
+		"""
+		The neighbours of the cells are those of the world, "blocked" the
+		flat array of obstacles (shared with the other fields) and
+		"sources" the flat array of source cells
+		"""
+		self.neighbours = world.neighbours
+		self.neighbours_of = world.neighbours_of
+		self.blocked = blocked
+		self.sources = sources
+		self.distance = numpy.full(len(sources), UNREACHABLE, numpy.int32)
+		self.distance[sources] = 0
+		self.spread(numpy.flatnonzero(sources))
+
+	## Lowers the distances around some cells until nothing changes
+	# @param frontier The flat indices of the cells whose distance dropped
+	def spread(self, frontier):
+		distance = self.distance
+		while len(frontier):
+			targets = self.neighbours(frontier).ravel()
+			candidates = numpy.repeat(distance[frontier] + 1, 8)
+			better = (candidates < distance[targets]) & ~self.blocked[targets]
+			targets = targets[better]
+			numpy.minimum.at(distance, targets, candidates[better])
+			frontier = numpy.unique(targets)
+
+	## Recomputes the distances that may have depended on a cell
+	# (after it became blocked or stopped being a source)
+	# @param index The flat index of the cell
+	def clear(self, index):
+		distance = self.distance
+		if distance[index] == UNREACHABLE:
+			return
+		affected = numpy.zeros(len(distance), bool)
+		affected[index] = True
+		frontier = numpy.array([index])
+		while len(frontier):
+			targets = self.neighbours(frontier)
+			following = distance[targets] == (distance[frontier] + 1)[:, None]
+			targets = numpy.unique(targets[following])
+			targets = targets[~affected[targets]]
+			affected[targets] = True
+			frontier = targets
+
+		cleared = numpy.flatnonzero(affected)
+		distance[cleared] = UNREACHABLE
+		sources = cleared[self.sources[cleared] & ~self.blocked[cleared]]
+		distance[sources] = 0
+		border = numpy.unique(self.neighbours(cleared).ravel())
+		border = border[~affected[border] & (distance[border] != UNREACHABLE)]
+		self.spread(numpy.concatenate((border, sources)))
+
+	## Makes a cell a source
+	# @param index The flat index of the cell
+	def add_source(self, index):
+		self.sources[index] = True
+		if not self.blocked[index] and self.distance[index] != 0:
+			self.distance[index] = 0
+			self.spread(numpy.array([index]))
+
+	## Stops a cell being a source
+	# @param index The flat index of the cell
+	def remove_source(self, index):
+		self.sources[index] = False
+		self.clear(index)
+
+	## Lets the ants through a cell (once its obstacle is removed)
+	# @param index The flat index of the cell
+	def unblock(self, index):
+		if self.sources[index]:
+			self.distance[index] = 0
+		else:
+			self.distance[index] = min(self.distance[self.neighbours_of(index)].min(), UNREACHABLE - 1) + 1
+		if self.distance[index] != UNREACHABLE:
+			self.spread(numpy.array([index]))
+
+	## Finds the neighbour of an ant closest to a source
+	# @param index The flat index of the cell of the ant
+	# @param direction The direction of the ant
+	# Returns the turn towards that neighbour (straight ahead on a tie),
+	# None if no source can be reached
+	def turn(self, index, direction):
+		distances = self.distance[self.neighbours_of(index)][(direction + TURNS) % 8]
+		best = distances.argmin()
+		if distances[best] == UNREACHABLE:
+			return None
+		return TURNS[best].item()
+
+class Navigation(object):
+	"""
+	The distance fields of all nests of a world (World.navigation, only
+	when the "navigation" setting is set)
+	The world tells it about every new or removed obstacle and every cell
+	whose food appears or runs out
+	"""
+	def __init__(self, world):
+		self.world = world
+		self.home = None
+		self.food = None
+
+	def reset(self):
+		"""
+		Drops the fields, they are built again when next used
+		"""
+		self.home = None
+		self.food = None
+
+	def build(self):
+		"""
+		Builds the fields from the cells of the world
+		"""
+		world = self.world
+		self.blocked = world.obstacle_grid.copy()
+		homes = world.home_grid
+		food = world.food_grid > 0
+		self.home = {}
+		self.food = {}
+		for nest_id in world.nests:
+			self.home[nest_id] = DistanceField(world, self.blocked, homes == nest_id)
+			self.food[nest_id] = DistanceField(world, self.blocked, food & (homes != nest_id))
+
+	def fields(self):
+		"""
+		Returns all distance fields, building them if needed
+		"""
+		if self.home is None:
+			self.build()
+		return self.home.values() + self.food.values()
+
+	## Returns the turn bringing an ant closer to its nest
+	# (None if the nest can not be reached)
+	def home_turn(self, ant):
+		if self.home is None:
+			self.build()
+		return self.home[ant.get_nest_id()].turn(ant.index, ant.direction)
+
+	## Returns the turn bringing an ant closer to food
+	# (None if no food can be reached)
+	def food_turn(self, ant):
+		if self.food is None:
+			self.build()
+		return self.food[ant.get_nest_id()].turn(ant.index, ant.direction)
+
+	## Updates the fields after an obstacle was made
+	# @param index The flat index of the cell
+	def block(self, index):
+		if self.home is None:
+			return
+		self.blocked[index] = True
+		for field in self.fields():
+			field.clear(index)
+
+	## Updates the fields after an obstacle was removed
+	# @param index The flat index of the cell
+	def unblock(self, index):
+		if self.home is None:
+			return
+		self.blocked[index] = False
+		for field in self.fields():
+			field.unblock(index)
+
+	## Updates the food fields after food appeared on an empty cell
+	# @param cell The cell
+	def food_added(self, cell):
+		if self.food is None:
+			return
+		for nest_id, field in self.food.items():
+			if cell.home != nest_id:
+				field.add_source(cell.index)
+
+	## Updates the food fields after the food of a cell ran out
+	# @param cell The cell
+	def food_removed(self, cell):
+		if self.food is None:
+			return
+		for field in self.food.values():
+			if field.sources[cell.index]:
+				field.remove_source(cell.index)
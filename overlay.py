@@ -0,0 +1,195 @@
+import numpy
+from pygame import Surface, surfarray, transform
+from pygame.constants import SRCALPHA
+from constants import HOME_SCENT_COLOUR, FOOD_SCENT_COLOUR, NEST_COLOURS
+from scent import VISIBLE_STEP, CUTOFF, scent_levels
+
+OVERLAY_MODES = ("max", "nest", "off")
+
+## Composites coloured layers into one RGBA array (later layers on top)
+# @param layers A list of (colour, alpha) pairs, alpha being an array of
+# values between 0 and 1
+def composite(layers):
+	alpha = numpy.zeros(layers[0][1].shape, numpy.float32)
+	rgb = numpy.zeros(alpha.shape + (3,), numpy.float32)
+	for colour, layer_alpha in layers:
+		below = alpha*(1 - layer_alpha)
+		new_alpha = layer_alpha + below
+		weight = numpy.where(new_alpha > 0, layer_alpha/numpy.maximum(new_alpha, 1e-6), 0)
+		rgb += (numpy.asarray(colour, numpy.float32) - rgb)*weight[..., None]
+		alpha = new_alpha
+	rgba = numpy.empty(alpha.shape + (4,), numpy.uint8)
+	rgba[..., :3] = rgb.round()
+	rgba[..., 3] = (alpha*255).round()
+	return rgba
+
+class ScentOverlay(object):
+	"""
+	Draws the scent of the whole world as a single translucent surface
+	built from the scent field, instead of blitting every cell
+	Modes (the "scent_overlay" setting):
+		- max : strongest home and food scent amongst all colonies
+		- nest : the scent of every colony in its own colour
+		- off : no scent is drawn
+	After the first frame only the cells whose visible level changed are
+	looked at and redrawn (see changes): the cells the scent field wrote,
+	and the cells whose scent decayed to a lower level, found from the
+	tick at which each cell drawn was due to drop a level. The levels of
+	the whole field are only compared with a diffusion kernel, which
+	spreads scent to cells nothing wrote.
+	"""
+	def __init__(self, world):
+		self.world = world
+		self.surface = None
+		## The visible levels of every cell, as last taken by a frame
+		self.levels = None
+		## tick -> flat indices of the cells whose level may drop by then
+		self.due = {}
+		## The tick every cell is due at (-1 if none)
+		self.next_due = None
+
+	## Returns the visible levels of the whole field for a frame drawn
+	# from scratch, and starts tracking them (None if the overlay is off)
+	def reset(self):
+		world = self.world
+		scent = world.scent
+		mode = world.settings["scent_overlay"]
+		scent.written[...] = False
+		self.due = {}
+		self.next_due = numpy.full(world.width*world.height, -1, numpy.int64)
+		if mode == "off":
+			self.levels = None
+			return None
+		home, food = scent.settled()
+		self.levels = scent_levels(home, food, mode == "nest")
+		if world.settings["diffusion_kernel"] is None:
+			indices = numpy.flatnonzero(self.levels.any(0))
+			xs, ys = numpy.divmod(indices, world.height)
+			self.schedule(indices, home[:, xs, ys], food[:, xs, ys])
+		return self.levels.copy()
+
+	## Returns the cells whose visible level changed since the last frame,
+	# as (xs, ys, levels), the levels shaped like those of reset
+	# (None if the overlay is off)
+	def changes(self):
+		world = self.world
+		scent = world.scent
+		if self.levels is None:
+			return None
+		kernel = world.settings["diffusion_kernel"] is not None
+		if kernel:
+			indices = numpy.arange(world.width*world.height)
+		else:
+			xs, ys = numpy.nonzero(scent.written)
+			scent.written[xs, ys] = False
+			indices = [xs*world.height + ys]
+			for tick in [tick for tick in self.due if tick <= scent.evaporations]:
+				due = self.due.pop(tick)
+				indices.append(due[self.next_due[due] == tick])
+			indices = numpy.unique(numpy.concatenate(indices))
+		xs, ys = numpy.divmod(indices, world.height)
+		home, food = scent.settled_cells(xs, ys)
+		levels = scent_levels(home, food, world.settings["scent_overlay"] == "nest")
+		changed = (levels != self.levels[:, xs, ys]).any(0)
+		xs, ys, levels = xs[changed], ys[changed], levels[:, changed]
+		self.levels[:, xs, ys] = levels
+		if not kernel:
+			self.schedule(indices, home, food)
+		return xs, ys, levels
+
+	## Files cells under the tick at which their visible level may drop
+	# next by evaporating (one tick early, so that float rounding never
+	# makes it late: the level is checked then and filed again)
+	# @param indices The flat indices of the cells
+	# @param home, food Their scents, shaped (nests, cells)
+	def schedule(self, indices, home, food):
+		rate = self.world.settings["evaporation_rate"]
+		if not len(indices) or rate <= 0:
+			return
+		values = numpy.concatenate((home, food)).astype(numpy.float64)
+		held = values > 0
+		values[~held] = 1
+		levels = numpy.ceil(numpy.minimum(values, 255)/VISIBLE_STEP)
+		bounds = numpy.where(levels > 1, (levels - 1)*VISIBLE_STEP, CUTOFF)
+		steps = numpy.ceil(numpy.log(bounds/values)/numpy.log(1 - rate))
+		steps[~held] = numpy.inf
+		steps = steps.min(0)
+		tick = self.world.scent.evaporations
+		due = numpy.where(numpy.isinf(steps), -1, tick + numpy.maximum(1, steps - 1)).astype(numpy.int64)
+		moved = due != self.next_due[indices]
+		indices, due = indices[moved], due[moved]
+		self.next_due[indices] = due
+		filed = due != -1
+		indices, due = indices[filed], due[filed]
+		ticks, inverse = numpy.unique(due, return_inverse=True)
+		for n, tick in enumerate(ticks.tolist()):
+			cells = indices[inverse == n]
+			if tick in self.due:
+				cells = numpy.concatenate((self.due[tick], cells))
+			self.due[tick] = cells
+
+	## Returns the colours of visible levels, as RGBA values
+	# @param levels The levels, shaped like those of reset
+	# @param mode The overlay mode
+	def colours(self, levels, mode):
+		alpha = numpy.minimum(levels*float(VISIBLE_STEP), 255)/255
+		if mode == "nest":
+			nests = len(levels)//2
+			layers = [(NEST_COLOURS[id % len(NEST_COLOURS)], numpy.maximum(alpha[id], alpha[nests + id])) for id in xrange(nests)]
+		else:
+			layers = [(HOME_SCENT_COLOUR, alpha[0]), (FOOD_SCENT_COLOUR, alpha[1])]
+		return composite(layers)
+
+	## Updates the overlay surface from the scent of a frame
+	# @param frame The Frame
+	# Returns the locations whose scent changed, None when the overlay was
+	# drawn from scratch or is off
+	def update(self, frame):
+		mode = frame.scent_mode
+		if mode == "off":
+			self.surface = None
+			return None
+
+		if frame.scent_levels is not None:
+			rgba = self.colours(frame.scent_levels, mode)
+			width, height = rgba.shape[:2]
+			small = Surface((width, height), SRCALPHA, 32)
+			pixels = surfarray.pixels3d(small)
+			pixels[...] = rgba[..., :3]
+			del pixels
+			pixels = surfarray.pixels_alpha(small)
+			pixels[...] = rgba[..., 3]
+			del pixels
+			size = self.world.cell_size
+			self.surface = transform.scale(small, (width*size, height*size))
+			return None
+
+		xs, ys, levels = frame.scent_cells
+		if len(xs):
+			rgba = self.colours(levels, mode)
+			size = self.world.cell_size
+			offsets = numpy.arange(size)
+			px = (xs*size)[:, None, None] + offsets[None, :, None]
+			py = (ys*size)[:, None, None] + offsets[None, None, :]
+			pixels = surfarray.pixels3d(self.surface)
+			pixels[px, py] = rgba[:, None, None, :3]
+			del pixels
+			pixels = surfarray.pixels_alpha(self.surface)
+			pixels[px, py] = rgba[:, None, None, 3]
+			del pixels
+		return zip(xs.tolist(), ys.tolist())
+
+	def render(self):
+		"""
+		Draws the whole overlay
+		"""
+		if self.surface is not None:
+			self.world.canvas.blit(self.surface, (0, 0))
+
+	## Draws the part of the overlay covering a single cell
+	# @param location The location of the cell
+	def render_cell(self, location):
+		if self.surface is not None:
+			x, y = location
+			size = self.world.cell_size
+			self.world.canvas.blit(self.surface, (x*size, y*size), (x*size, y*size, size, size))
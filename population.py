@@ -0,0 +1,231 @@
+import numpy
+from timeit import default_timer
+from constants import SCENT_FADE
+from task_manager import TASKS, TaskManager
+
+class Field(object):
+	"""
+	Attribute of an ant stored in an array of the Population
+	"""
+	def __init__(self, name):
+		self.name = name
+
+	def __get__(self, ant, owner=None):
+		if ant is None:
+			return self
+		return getattr(ant.population, self.name).item(ant.slot)
+
+	def __set__(self, ant, value):
+		getattr(ant.population, self.name)[ant.slot] = value
+
+class LocationField(object):
+	"""
+	The location of an ant, stored in the x and y arrays of the Population
+	"""
+	def __get__(self, ant, owner=None):
+		if ant is None:
+			return self
+		population = ant.population
+		return population.x.item(ant.slot), population.y.item(ant.slot)
+
+	def __set__(self, ant, location):
+		population = ant.population
+		population.x[ant.slot], population.y[ant.slot] = location
+
+class AntProxy(object):
+	"""
+	Mixin turning an Ant into a thin proxy over a slot of the Population
+	The ant keeps its usual API, its state lives in the arrays
+	(the proxy classes made by Population.proxy_class add the population
+	and slot attributes)
+	"""
+	__slots__ = ()
+	location = LocationField()
+	index = Field("index")
+	id = Field("id")
+	direction = Field("direction")
+	food = Field("food")
+	health = Field("health")
+	food_scent_strength = Field("food_scent_strength")
+	home_scent_strength = Field("home_scent_strength")
+
+	## The row of the ant in World.senses
+	@property
+	def sense(self):
+		return self.slot
+
+	def __init__(self, world, image, direction, location, nest):
+		self.population = world.population
+		self.slot = self.population.allocate(self, nest.id)
+		super(AntProxy, self).__init__(world, image, direction, location, nest)
+		self.population.set_task(self.slot, self.task_manager.active_task)
+
+class Population(object):
+	"""
+	Structure of arrays holding the state of all ants of a world
+	Every ant owns a slot, slots of dead ants are reused
+	"""
+	FIELDS = (
+		("x", numpy.int_),
+		("y", numpy.int_),
+		("index", numpy.int_),
+		("direction", numpy.int_),
+		("food", numpy.float64),
+		("health", numpy.float64),
+		("food_scent_strength", numpy.float64),
+		("home_scent_strength", numpy.float64),
+		("nest", numpy.int_),
+		("task", numpy.int_),
+		("id", numpy.int_),
+		("alive", bool),
+	)
+
+	def __init__(self, capacity=256, lifecycle=None):
+		"""
+		"lifecycle" is told about the ants whose health drops below
+		zero while stepping
+		"""
+		self.capacity = capacity
+		self.lifecycle = lifecycle
+		self.size = 0
+		self.free = []
+		self.ants = [None]*capacity
+		for name, dtype in self.FIELDS:
+			setattr(self, name, numpy.zeros(capacity, dtype))
+
+		self.task_names = [task.name for task in TASKS]
+		self.health_costs = numpy.array([task.health_cost for task in TASKS])
+		self.fades_scent = numpy.array([task.fades_scent for task in TASKS], bool)
+		self.proxy_classes = {}
+
+	## Returns the proxy class for a type of ant
+	# @param ant_type The Ant subclass
+	def proxy_class(self, ant_type):
+		if ant_type not in self.proxy_classes:
+			self.proxy_classes[ant_type] = type(ant_type.__name__, (AntProxy, ant_type), {"__slots__": ("population", "slot")})
+		return self.proxy_classes[ant_type]
+
+	## Reserves a slot for a new ant
+	# @param ant The ant proxy
+	# @param nest_id The id of the nest the ant belongs to
+	def allocate(self, ant, nest_id):
+		if self.free:
+			slot = self.free.pop()
+		else:
+			if self.size == self.capacity:
+				self.grow()
+			slot = self.size
+			self.size += 1
+		for name, dtype in self.FIELDS:
+			getattr(self, name)[slot] = 0
+		self.ants[slot] = ant
+		self.nest[slot] = nest_id
+		self.alive[slot] = True
+		return slot
+
+	## Makes the proxy of an ant whose slot was filled in by another
+	# process (see stepping.py), leaving the arrays untouched: the ant
+	# only gets what performing its tasks needs (it is never drawn)
+	# @param ant_type The Ant subclass
+	# @param slot The slot of the ant
+	# @param world The world
+	# @param nest The nest of the ant
+	def adopt(self, ant_type, slot, world, nest):
+		ant = object.__new__(self.proxy_class(ant_type))
+		ant.population = self
+		ant.slot = slot
+		ant.world = world
+		ant.size = (1, 1)
+		ant.image = None
+		ant.nest = nest
+		ant.task_manager = TaskManager(ant, ant.tasks, ant.transitions)
+		self.ants[slot] = ant
+		return ant
+
+	## Frees the slot of an ant
+	# @param slot The slot of the ant
+	def release(self, slot):
+		self.alive[slot] = False
+		self.ants[slot] = None
+		self.free.append(slot)
+
+	def grow(self):
+		"""
+		Doubles the capacity of all arrays
+		"""
+		for name, dtype in self.FIELDS:
+			array = numpy.zeros(self.capacity*2, dtype)
+			array[:self.capacity] = getattr(self, name)
+			setattr(self, name, array)
+		self.ants.extend([None]*self.capacity)
+		self.capacity *= 2
+
+	## Records the active task of an ant
+	# @param slot The slot of the ant
+	# @param task The active task
+	def set_task(self, slot, task):
+		self.task[slot] = task.id
+
+	## Advances all ants by one step, task by task
+	#	- all ants with the same task perform it one after another
+	#	- the costs of their tasks are applied to all ants at once
+	#	- ants whose task asked for a new one switch to it
+	# Ants born during the step only act from the next step on
+	# @param profiler Optional Profiler recording every task group
+	def step(self, profiler=None):
+		size = self.size
+		tasks = self.task[:size].copy()
+		slots = numpy.flatnonzero(self.alive[:size])
+		switches = self.perform(slots, tasks, profiler)
+		self.apply_costs(slots, tasks)
+		self.apply_switches(switches, profiler)
+		return self
+
+	## Has some ants perform their active task, task by task
+	# @param slots The slots of the ants, in increasing order
+	# @param tasks The tasks of all slots at the start of the step
+	# @param profiler Optional Profiler recording every task group
+	# Returns the (ant, new task id) pairs of the ants asking for a new task
+	def perform(self, slots, tasks, profiler=None):
+		switches = []
+		for task in TASKS:
+			group = slots[tasks[slots] == task.id]
+			if not len(group):
+				continue
+			ants = [self.ants[slot] for slot in group.tolist()]
+			if profiler is not None:
+				start = default_timer()
+			for ant in ants:
+				new_task = task.perform_task(ant)
+				if new_task is not None:
+					switches.append((ant, new_task))
+			if profiler is not None:
+				profiler.record_task(task.name, default_timer() - start, len(ants))
+		return switches
+
+	## Applies the costs of their task to ants, all at once (see Task),
+	# and queues the ants it kills
+	# @param slots The slots of the ants
+	# @param tasks The tasks of all slots at the start of the step
+	def apply_costs(self, slots, tasks):
+		fading = slots[self.fades_scent[tasks[slots]]]
+		self.food_scent_strength[fading] *= SCENT_FADE
+		self.home_scent_strength[fading] *= SCENT_FADE
+		health = self.health[slots]
+		costs = self.health_costs[tasks[slots]]
+		self.health[slots] = health - costs
+		if self.lifecycle is not None:
+			for slot in slots[(health >= 0) & (health - costs < 0)].tolist():
+				self.lifecycle.queue_death(self.ants[slot])
+		return self
+
+	## Switches ants to the tasks they asked for
+	# @param switches The (ant, new task id) pairs
+	# @param profiler Optional Profiler counting the transitions
+	def apply_switches(self, switches, profiler=None):
+		for ant, new_task in switches:
+			if profiler is not None:
+				profiler.record_transition(ant.task_manager.active_task.name, TASKS[new_task].name)
+			ant.task_manager.switch_task(new_task)
+			self.task[ant.slot] = new_task
+		return self
@@ -0,0 +1,105 @@
+import sys
+from timeit import default_timer
+
+class Profiler(object):
+	"""
+	Opt-in instrumentation of the hot paths of the simulation
+		- calls and cumulative time of every task
+		- counts of the transitions between tasks
+		- calls and cumulative time of the phases of a tick
+		  (ants, evaporation, dead ants, render)
+	The world only goes through the profiler when one is attached,
+	so a disabled profiler costs one check per tick
+	"""
+	def __init__(self, report_every=0, output=None):
+		"""
+		Prints a report to "output" (stdout by default) every
+		"report_every" ticks, never if it is zero
+		"""
+		self.report_every = report_every
+		self.output = output or sys.stdout
+		self.reset()
+
+	def reset(self):
+		"""
+		Clears all recorded statistics
+		"""
+		self.ticks = 0
+		self.tasks = {}
+		self.transitions = {}
+		self.phases = {}
+
+	## Records one or more performances of a task
+	# @param name The name of the task
+	# @param elapsed The time taken in seconds
+	# @param calls The number of performances
+	def record_task(self, name, elapsed, calls=1):
+		stats = self.tasks.setdefault(name, [0, 0.])
+		stats[0] += calls
+		stats[1] += elapsed
+
+	## Records a switch from one task to another
+	# @param old The name of the ended task
+	# @param new The name of the started task
+	def record_transition(self, old, new):
+		key = (old, new)
+		self.transitions[key] = self.transitions.get(key, 0) + 1
+
+	## Times a phase of a tick
+	# @param name The name of the phase
+	# @param function The function doing the work of the phase
+	# Returns what the function returns
+	def phase(self, name, function):
+		start = default_timer()
+		result = function()
+		stats = self.phases.setdefault(name, [0, 0.])
+		stats[0] += 1
+		stats[1] += default_timer() - start
+		return result
+
+	## Advances the world by one tick, recording every phase
+	# @param world The world
+	def advance(self, world):
+		self.phase("sensing", world.sense_ants)
+		if world.population is not None:
+			self.phase("ants", lambda: world.step_population(self))
+		else:
+			self.phase("ants", lambda: world.step_ants(self))
+		self.phase("evaporation", world.evaporate_scent)
+		self.phase("dead ants", world.remove_dead_ants)
+
+		self.ticks += 1
+		if self.report_every and self.ticks % self.report_every == 0:
+			self.output.write(self.report())
+			self.output.flush()
+
+	def stats(self):
+		"""
+		Returns the recorded statistics as a dictionary
+		"""
+		def timing(stats):
+			calls, elapsed = stats
+			return {"calls": calls, "time": elapsed, "mean": elapsed/calls if calls else 0.}
+
+		return {
+			"ticks": self.ticks,
+			"tasks": dict((name, timing(stats)) for name, stats in self.tasks.items()),
+			"phases": dict((name, timing(stats)) for name, stats in self.phases.items()),
+			"transitions": dict(("%s -> %s" % key, count) for key, count in self.transitions.items()),
+		}
+
+	def report(self):
+		"""
+		Returns the recorded statistics as readable text,
+		slowest entries first
+		"""
+		stats = self.stats()
+		lines = ["Profile after %d ticks" % stats["ticks"]]
+		for title in ("phases", "tasks"):
+			lines.append("  %-20s %10s %12s %12s" % (title, "calls", "total (s)", "mean (us)"))
+			for name, timing in sorted(stats[title].items(), key=lambda item: -item[1]["time"]):
+				lines.append("  %-20s %10d %12.4f %12.2f" % (name, timing["calls"], timing["time"], timing["mean"]*1e6))
+		lines.append("  transitions")
+		for name, count in sorted(stats["transitions"].items(), key=lambda item: -item[1]):
+			lines.append("  %-40s %10d" % (name, count))
+		return "\n".join(lines) + "\n"
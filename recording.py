@@ -0,0 +1,362 @@
+"""
+Recording of the changes of a world tick by tick, and their replay
+
+A recording is an append-only stream of records, each starting with a
+byte giving its kind:
+	- TICK : the changes that follow happened during that tick
+	- MOVE : an ant moved or turned (id, cell index, direction)
+	- CARRY : the food carried by an ant changed (id, food)
+	- TASK : an ant switched task (id, task)
+	- TASK_NAME : the name of a task number, written before its first use
+	- FOOD : the food of a cell changed (cell index, food)
+	- OBSTACLE : an obstacle was made or removed (cell index, flag)
+	- BIRTH : a new ant (id, type, nest, cell index, direction, task)
+	- DEATH : an ant died (id)
+	- KEYFRAME : a full snapshot of the world (see snapshot.py),
+	  written every few ticks so that a replay can seek
+"""
+import struct
+from collections import namedtuple
+
+from snapshot import ANT_TYPES, ant_type_index, write_world, open_arrays, load_world, restore_scent
+
+MAGIC = "ANTREC01"
+
+TICK, MOVE, CARRY, TASK, TASK_NAME, FOOD, OBSTACLE, BIRTH, DEATH, KEYFRAME = range(10)
+RECORDS = {
+	TICK: struct.Struct("<BI"),
+	MOVE: struct.Struct("<BIIB"),
+	CARRY: struct.Struct("<BIf"),
+	TASK: struct.Struct("<BIB"),
+	TASK_NAME: struct.Struct("<BBB"),
+	FOOD: struct.Struct("<BIf"),
+	OBSTACLE: struct.Struct("<BIB"),
+	BIRTH: struct.Struct("<BIBBIBB"),
+	DEATH: struct.Struct("<BI"),
+	KEYFRAME: struct.Struct("<BQ"),
+}
+
+class Recorder(object):
+	"""
+	Records the changes of a world after every tick
+	Attached to the world (World.recorder) it is told about
+		- every tick by World.advance
+		- every cell marked dirty by World.mark_dirty
+		- births and deaths as a listener of the Lifecycle
+	Moves, task switches and carried food are found by comparing every
+	ant with its state at the end of the previous tick
+	"""
+	def __init__(self, world, path, keyframe_every=100):
+		"""
+		Starts a new recording in "path" with a keyframe now and then
+		every "keyframe_every" ticks (never again if zero)
+		"""
+		self.world = world
+		self.keyframe_every = keyframe_every
+		self.stream = open(path, "wb")
+		self.stream.write(MAGIC)
+		self.tick = 0
+		self.records = []
+		self.touched = set()
+		self.task_ids = {}
+		self.ant_state = {}
+		self.cell_food = world.food_grid.copy()
+		self.cell_obstacle = world.obstacle_grid.copy()
+		for id, ant in world.ants.items():
+			self.ant_state[id] = self.state(ant)
+
+		world.recorder = self
+		world.lifecycle.add_listener(self)
+		self.write_keyframe()
+
+	def close(self):
+		"""
+		Writes the pending changes, detaches from the world and
+		closes the stream
+		"""
+		self.flush()
+		self.world.recorder = None
+		self.world.lifecycle.remove_listener(self)
+		self.stream.close()
+
+	def add(self, kind, *values):
+		self.records.append(RECORDS[kind].pack(kind, *values))
+
+	def flush(self):
+		"""
+		Writes the buffered records to the stream
+		"""
+		self.stream.write("".join(self.records))
+		self.records = []
+		self.stream.flush()
+
+	## Returns the number of a task, writing its name the first time
+	# @param name The name of the task
+	def task_id(self, name):
+		if name not in self.task_ids:
+			self.task_ids[name] = len(self.task_ids)
+			self.add(TASK_NAME, self.task_ids[name], len(name))
+			self.records.append(name)
+		return self.task_ids[name]
+
+	## Returns what is recorded of an ant: cell index, direction, food
+	# and task
+	def state(self, ant):
+		return ant.index, ant.direction, ant.food, ant.task_manager.active_task.name
+
+	## Records a cell marked dirty (see World.mark_dirty)
+	# @param location The location of the cell
+	def touch(self, location):
+		self.touched.add(location)
+
+	def ant_born(self, ant):
+		index, direction, food, task = self.ant_state[ant.id] = self.state(ant)
+		self.add(BIRTH, ant.id, ant_type_index(ant), ant.get_nest_id(), index, direction, self.task_id(task))
+
+	def ant_died(self, ant):
+		del self.ant_state[ant.id]
+		self.add(DEATH, ant.id)
+
+	def record_tick(self):
+		"""
+		Records the changes of the tick that just ended
+		(called by World.advance)
+		"""
+		world = self.world
+		self.tick += 1
+		changes = self.records
+		self.records = []
+		self.add(TICK, self.tick)
+		self.records.extend(changes)
+
+		for id, ant in world.ants.items():
+			state = self.state(ant)
+			old = self.ant_state[id]
+			if state == old:
+				continue
+			index, direction, food, task = state
+			if index != old[0] or direction != old[1]:
+				self.add(MOVE, id, index, direction)
+			if food != old[2]:
+				self.add(CARRY, id, food)
+			if task != old[3]:
+				self.add(TASK, id, self.task_id(task))
+			self.ant_state[id] = state
+
+		for location in self.touched:
+			index = world.index(location)
+			cell = world.cells[index]
+			if cell.obstacle != self.cell_obstacle[index]:
+				self.cell_obstacle[index] = cell.obstacle
+				self.add(OBSTACLE, index, cell.obstacle)
+			if cell.food != self.cell_food[index]:
+				self.cell_food[index] = cell.food
+				self.add(FOOD, index, cell.food)
+		self.touched.clear()
+
+		self.flush()
+		if self.keyframe_every and self.tick % self.keyframe_every == 0:
+			self.write_keyframe()
+
+	def write_keyframe(self):
+		"""
+		Writes a snapshot of the world after its length
+		"""
+		start = self.stream.tell()
+		self.stream.write(RECORDS[KEYFRAME].pack(KEYFRAME, 0))
+		length = write_world(self.world, self.stream)
+		self.stream.seek(start)
+		self.stream.write(RECORDS[KEYFRAME].pack(KEYFRAME, length))
+		self.stream.seek(0, 2)
+		self.stream.flush()
+
+Keyframe = namedtuple("Keyframe", ("tick", "offset"))
+
+class Replay(object):
+	"""
+	Rebuilds the world of a recording tick by tick, without simulating it
+	The world only changes as recorded, its scent is the one of the
+	last keyframe passed
+	"""
+	def __init__(self, path, images, settings=None):
+		"""
+		Indexes the ticks and keyframes of the recording in "path" and
+		loads the world of the first keyframe
+		"settings" overrides the saved settings (eg. "render_mode")
+		"""
+		self.path = path
+		self.images = images
+		self.settings = dict(settings or {})
+		self.settings["population"] = "objects"
+		with open(path, "rb") as stream:
+			self.data = stream.read()
+		if not self.data.startswith(MAGIC):
+			raise ValueError("%s is not a recording" % path)
+		self.index()
+		self.world = None
+		self.seek(0)
+
+	def index(self):
+		"""
+		Finds the position of every tick and keyframe in the recording
+		A record cut short at the end (recording in progress) is ignored
+		"""
+		self.ticks = [len(MAGIC)]
+		self.keyframes = []
+		self.end = position = len(MAGIC)
+		data = self.data
+		while position < len(data):
+			kind = ord(data[position])
+			record = RECORDS[kind]
+			if position + record.size > len(data):
+				break
+			values = record.unpack_from(data, position)
+			size = record.size
+			if kind == TASK_NAME:
+				size += values[2]
+			elif kind == KEYFRAME:
+				size += values[1]
+			if position + size > len(data):
+				break
+			if kind == TICK:
+				self.ticks.append(position)
+			elif kind == KEYFRAME:
+				self.keyframes.append(Keyframe(len(self.ticks) - 1, position))
+			position += size
+			self.end = position
+		self.ticks.append(self.end)
+		if not self.keyframes:
+			raise ValueError("%s holds no keyframe" % self.path)
+
+	def last_tick(self):
+		"""
+		The number of ticks recorded
+		"""
+		return len(self.ticks) - 2
+
+	## Moves to a tick, starting from the keyframe before it
+	# @param tick The tick, clamped to the recorded ones
+	def seek(self, tick):
+		tick = max(0, min(tick, self.last_tick()))
+		keyframe = [keyframe for keyframe in self.keyframes if keyframe.tick <= tick][-1]
+		if self.world is None or not (keyframe.tick <= self.tick <= tick):
+			offset = keyframe.offset + RECORDS[KEYFRAME].size
+			world = load_world(self.path, self.images, self.settings, offset)
+			world.full_redraw = True
+			self.load_task_names(keyframe.offset)
+			self.world = world
+			self.tick = keyframe.tick
+		while self.tick < tick:
+			self.step()
+		return self
+
+	## Reads the task names written before a position
+	def load_task_names(self, end):
+		self.task_names = {}
+		position = len(MAGIC)
+		while position < end:
+			kind = ord(self.data[position])
+			values = RECORDS[kind].unpack_from(self.data, position)
+			size = RECORDS[kind].size
+			if kind == TASK_NAME:
+				start = position + size
+				self.task_names[values[1]] = self.data[start:start + values[2]]
+				size += values[2]
+			elif kind == KEYFRAME:
+				size += values[1]
+			position += size
+
+	def step(self):
+		"""
+		Applies the changes of the next tick
+		Returns False at the end of the recording
+		"""
+		if self.tick >= self.last_tick():
+			return False
+		self.tick += 1
+		position, end = self.ticks[self.tick], self.ticks[self.tick + 1]
+		data = self.data
+		while position < end:
+			kind = ord(data[position])
+			record = RECORDS[kind]
+			values = record.unpack_from(data, position)[1:]
+			position += record.size
+			if kind == TASK_NAME:
+				self.task_names[values[0]] = data[position:position + values[1]]
+				position += values[1]
+			elif kind == KEYFRAME:
+				self.load_scent(position)
+				position += values[0]
+			elif kind != TICK:
+				self.apply(kind, values)
+		return True
+
+	## Replaces the scent with the one of a keyframe
+	# @param offset The position of the keyframe snapshot
+	def load_scent(self, offset):
+		header, array = open_arrays(self.path, offset)
+		restore_scent(self.world, header, array)
+
+	## Applies a recorded change to the world
+	# @param kind The kind of record
+	# @param values The values of the record
+	def apply(self, kind, values):
+		world = self.world
+		if kind == MOVE:
+			id, index, direction = values
+			ant = world.ants[id]
+			self.place(ant, index)
+			ant.direction = direction
+		elif kind == CARRY:
+			id, food = values
+			ant = world.ants[id]
+			ant.food = food
+			world.mark_dirty(ant.location)
+		elif kind == TASK:
+			id, task = values
+			world.ants[id].task_manager.set_active_task(self.task_names[task])
+		elif kind == FOOD:
+			index, food = values
+			cell = world.cells[index]
+			cell.food = food
+			world.mark_dirty(cell.location)
+		elif kind == OBSTACLE:
+			index, obstacle = values
+			cell = world.cells[index]
+			if obstacle:
+				cell.obstacle = True
+				x, y = cell.location
+				world.scent.block(x, y)
+				world.mark_dirty(cell.location)
+			else:
+				cell.remove_obstacle()
+		elif kind == BIRTH:
+			id, type_index, nest_id, index, direction, task = values
+			location = world.cells[index].location
+			ant = ANT_TYPES[type_index](world, self.images.get("ant"), direction, location, world.nests[nest_id])
+			ant.id = id
+			ant.task_manager.set_active_task(self.task_names[task])
+			world.ants[id] = ant
+			world.spatial.add(ant)
+			self.place(ant, index)
+		elif kind == DEATH:
+			id, = values
+			ant = world.ants.pop(id)
+			world.spatial.remove(ant)
+			if world.occupancy[ant.index] == id:
+				world.occupancy[ant.index] = -1
+			world.mark_dirty(ant.location)
+
+	## Puts an ant on a cell
+	# @param ant The ant
+	# @param index The flat index of the cell
+	def place(self, ant, index):
+		world = self.world
+		if world.occupancy[ant.index] == ant.id:
+			world.occupancy[ant.index] = -1
+		world.mark_dirty(ant.location)
+		ant.index = index
+		ant.location = world.cells[index].location
+		world.spatial.update(ant)
+		world.occupancy[index] = ant.id
+		world.mark_dirty(ant.location)
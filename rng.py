@@ -0,0 +1,81 @@
+import random
+import numpy
+
+class BlockRandom(object):
+	"""
+	Random numbers taken from blocks pre-generated by NumPy
+	Each draw is a list lookup instead of a call into Python's random
+	module, blocks are refilled when used up
+	Offers the part of the random.Random API used by the simulation
+	"""
+	def __init__(self, seed=None, block_size=4096):
+		self.generator = numpy.random.RandomState(seed)
+		self.block_size = block_size
+		self.block = []
+		self.position = 0
+
+	def refill(self):
+		"""
+		Generates the next block of random floats
+		"""
+		self.block = self.generator.random_sample(self.block_size).tolist()
+		self.position = 0
+
+	def random(self):
+		"""
+		Returns a random float in [0, 1)
+		"""
+		if self.position == len(self.block):
+			self.refill()
+		value = self.block[self.position]
+		self.position += 1
+		return value
+
+	## Returns a random integer N such that a <= N <= b
+	def randint(self, a, b):
+		return a + int(self.random()*(b - a + 1))
+
+	## Returns a random element of a non empty sequence
+	def choice(self, seq):
+		return seq[int(self.random()*len(seq))]
+
+	## Returns k distinct random elements of a population
+	def sample(self, population, k):
+		return [population[i] for i in self.generator.permutation(len(population))[:k].tolist()]
+
+	def getstate(self):
+		"""
+		Returns the full state, to be restored with setstate
+		"""
+		return self.generator.get_state(), list(self.block), self.position
+
+	def setstate(self, state):
+		generator_state, block, position = state
+		self.generator.set_state(generator_state)
+		self.block = list(block)
+		self.position = position
+
+## Multiplier spreading the seeds of the streams of a world apart
+STREAM_SEED_FACTOR = 1000003
+
+## Creates the random number generator of a world
+# @param settings The settings of the world
+# 	- "seed" : the seed, None for an unpredictable run
+# 	- "rng" : "python" for Python's Mersenne Twister or
+# 	  "blocks" for blocks pre-generated by NumPy
+# 	- "rng_block_size" : the size of the blocks
+def make_rng(settings):
+	if settings["rng"] == "blocks":
+		return BlockRandom(settings["seed"], settings["rng_block_size"])
+	return random.Random(settings["seed"])
+
+## Creates the random number generator of one of the streams of a world
+# (eg. a tile, see stepping.py), seeded from the seed of the world and
+# the number of the stream
+# @param settings The settings of the world (see make_rng)
+# @param stream The number of the stream
+def make_stream_rng(settings, stream):
+	stream_settings = dict(settings)
+	if settings["seed"] is not None:
+		stream_settings["seed"] = (settings["seed"]*STREAM_SEED_FACTOR + stream + 1) % 2**32
+	return make_rng(stream_settings)
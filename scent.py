@@ -0,0 +1,507 @@
+import os
+from multiprocessing.pool import ThreadPool
+
+import numpy
+from constants import DIRECTIONS
+
+DX = numpy.array([dx for dx, dy in DIRECTIONS])
+DY = numpy.array([dy for dx, dy in DIRECTIONS])
+CUTOFF = .3
+VISIBLE_STEP = 16
+
+## Quantises scent into the levels the renderer can tell apart
+# @param scent A scent value or an array of them
+def visible_level(scent):
+	return numpy.ceil(numpy.minimum(scent, 255) / VISIBLE_STEP)
+
+## Returns the visible levels of home and food scents
+# @param home, food The scents, shaped (nests, ...)
+# @param per_nest Keep the levels of every colony apart
+# Shaped (2, ...) for the strongest home and food scent, or (2*nests, ...)
+# with the home scents first when per_nest is set
+def scent_levels(home, food, per_nest=False):
+	if per_nest:
+		return visible_level(numpy.concatenate((home, food))).astype(numpy.uint8)
+	levels = numpy.empty((2,) + home.shape[1:], numpy.uint8)
+	levels[0] = visible_level(home.max(0))
+	levels[1] = visible_level(food.max(0))
+	return levels
+
+## Removes the scent of some locations, returns the scent removed from
+# every colony
+# @param scent A scent array shaped (nests, ...)
+# @param where The locations to clear (a mask broadcasting with scent)
+def cut(scent, where):
+	removed = numpy.where(where, scent, 0).reshape(len(scent), -1).sum(1, numpy.float64)
+	scent[where] = 0
+	return removed
+
+class ScentField(object):
+	"""
+	Dense storage of the home and food scents of every colony
+	Each kind of scent is a float32 array shaped (nests, width, height)
+	The total scent of every colony (see mass) is kept up to date by
+	the methods adding, clearing and evaporating scent, the arrays must
+	not be written directly (call recount after replacing them)
+	These methods also mark the locations they write in "written", for
+	the ScentOverlay to redraw
+	"""
+	def __init__(self, nests, width, height):
+		self.nests = nests
+		self.width = width
+		self.height = height
+		self.home = numpy.zeros((nests, width, height), numpy.float32)
+		self.food = numpy.zeros((nests, width, height), numpy.float32)
+		self.blocked = numpy.zeros((width, height), bool)
+		## The total home and food scent of every colony
+		self.home_mass = numpy.zeros(nests)
+		self.food_mass = numpy.zeros(nests)
+		## The locations written since the ScentOverlay last looked
+		self.written = numpy.zeros((width, height), bool)
+		## The ticks of evaporation so far
+		self.evaporations = 0
+
+	## Get the home scent at a location
+	# @param x, y The location of the cell
+	# @param id The id of the nest
+	def get_home_scent(self, x, y, id):
+		return float(self.home[id, x, y])
+
+	## Get the food scent at a location
+	# @param x, y The location of the cell
+	# @param id The id of the nest
+	def get_food_scent(self, x, y, id):
+		return float(self.food[id, x, y])
+
+	## Adds home scent at a location (obstacles never hold scent)
+	# @param x, y The location of the cell
+	# @param amt The amount of scent to add
+	# @param id The id of the nest
+	def add_home_scent(self, x, y, amt, id):
+		self.written[x, y] = True
+		if self.blocked[x, y]:
+			self.home[id, x, y] = 0
+		else:
+			self.home[id, x, y] += amt
+			self.home_mass[id] += amt
+		return self
+
+	## Adds food scent at a location (obstacles never hold scent)
+	# @param x, y The location of the cell
+	# @param amt The amount of scent to add
+	# @param id The id of the nest
+	def add_food_scent(self, x, y, amt, id):
+		self.written[x, y] = True
+		if self.blocked[x, y]:
+			self.food[id, x, y] = 0
+		else:
+			self.food[id, x, y] += amt
+			self.food_mass[id] += amt
+		return self
+
+	## Adds home and food scent to the 8 cells around a location
+	# @param x, y The location of the centre cell
+	# @param home_amt The amount of home scent to add
+	# @param food_amt The amount of food scent to add
+	# @param id The id of the nest
+	def spread_scent(self, x, y, home_amt, food_amt, id):
+		xs = (x + DX) % self.width
+		ys = (y + DY) % self.height
+		blocked = self.blocked[xs, ys]
+		self.written[xs, ys] = True
+		self.home[id, xs, ys] += home_amt
+		self.food[id, xs, ys] += food_amt
+		if blocked.any():
+			self.home[id, xs[blocked], ys[blocked]] = 0
+			self.food[id, xs[blocked], ys[blocked]] = 0
+		count = len(xs) - blocked.sum()
+		self.home_mass[id] += home_amt*count
+		self.food_mass[id] += food_amt*count
+		return self
+
+	## Returns the scents of colonies at many locations at once
+	# @param ids The ids of the nests (an array)
+	# @param xs, ys The locations (arrays broadcasting with ids)
+	# Returns the home and the food scents, shaped like the locations
+	def get_scents(self, ids, xs, ys):
+		return self.home[ids, xs, ys], self.food[ids, xs, ys]
+
+	## Returns the up to date scents of every colony at some locations,
+	# leaving the field untouched
+	# @param xs, ys The locations (arrays)
+	# Returns the home and the food scents, shaped (nests,) + the shape
+	# of the locations
+	def settled_cells(self, xs, ys):
+		return self.home[:, xs, ys], self.food[:, xs, ys]
+
+	def get_max_home_scent(self, x, y):
+		"""
+		Maximum home scent at a location amongst all colonies
+		"""
+		return float(self.home[:, x, y].max())
+
+	def get_max_food_scent(self, x, y):
+		"""
+		Maximum food scent at a location amongst all colonies
+		"""
+		return float(self.food[:, x, y].max())
+
+	## Returns the visible levels of the scent of every location
+	# @param per_nest Keep the levels of every colony apart
+	# Shaped (2, width, height) for the strongest home and food scent, or
+	# (2*nests, width, height) with the home scents first when per_nest is set
+	def visible_levels(self, per_nest=False):
+		home, food = self.settled()
+		return scent_levels(home, food, per_nest)
+
+	## Marks a location as an obstacle and clears its scent
+	# @param x, y The location of the cell
+	def block(self, x, y):
+		self.blocked[x, y] = True
+		self.written[x, y] = True
+		self.home_mass -= self.home[:, x, y]
+		self.food_mass -= self.food[:, x, y]
+		self.home[:, x, y] = 0
+		self.food[:, x, y] = 0
+		return self
+
+	## Allows scent at a location again
+	# @param x, y The location of the cell
+	def unblock(self, x, y):
+		self.blocked[x, y] = False
+		return self
+
+	def settle(self):
+		"""
+		Brings the whole field up to date (nothing to do, the scent
+		evaporates eagerly)
+		"""
+		return self
+
+	def settled(self):
+		"""
+		Returns the up to date home and food scents of the whole field
+		(the arrays of the field, the scent evaporates eagerly), they must
+		not be modified
+		"""
+		return self.home, self.food
+
+	def mass(self):
+		"""
+		Returns the total home scent and food scent of every colony
+		(kept up to date, see recount)
+		"""
+		return self.home_mass.tolist(), self.food_mass.tolist()
+
+	def recount(self):
+		"""
+		Sums the total scent of every colony over the whole field
+		(after the arrays were replaced, eg. by loading a snapshot)
+		"""
+		home, food = self.settled()
+		self.home_mass = home.sum((1, 2), numpy.float64)
+		self.food_mass = food.sum((1, 2), numpy.float64)
+		return self
+
+	## Evaporates the scent of a single location
+	# @param x, y The location of the cell
+	# @param rate The rate at which evaporation happens
+	# Follows the decay law
+	def evaporate_cell(self, x, y, rate):
+		self.written[x, y] = True
+		for scent, mass in ((self.home[:, x, y], self.home_mass), (self.food[:, x, y], self.food_mass)):
+			mass -= scent
+			scent *= 1 - rate
+			scent[scent < CUTOFF] = 0
+			mass += scent
+		return self
+
+	## Evaporates the scent of the whole world in one pass
+	# @param rate The rate at which evaporation happens
+	# @param kernel Optional 3x3 diffusion kernel applied before the decay
+	# Follows the decay law, scent below the cutoff is removed
+	# (the total scent decays with it, the removed scent is taken off;
+	# diffusion does not keep the total, it is summed again)
+	def evaporate(self, rate, kernel=None):
+		self.evaporations += 1
+		for scent, mass in ((self.home, self.home_mass), (self.food, self.food_mass)):
+			if kernel is not None:
+				scent[...] = self.diffuse(scent, kernel)
+			scent *= 1 - rate
+			low = scent < CUTOFF
+			if kernel is not None:
+				scent[low] = 0
+				mass[...] = scent.sum((1, 2), numpy.float64)
+			else:
+				mass *= 1 - rate
+				mass -= cut(scent, low)
+		return self
+
+	## Evaporates the scent of the whole world tile by tile on a pool of threads
+	# @param rate The rate at which evaporation happens
+	# @param kernel Optional 3x3 diffusion kernel applied before the decay
+	# @param tiles The tiles, as made by make_tiles
+	# @param pool The thread pool the tiles are processed on
+	# Gives the same result as evaporate, numpy releases the GIL so the
+	# tiles are processed in parallel
+	def evaporate_tiles(self, rate, kernel, tiles, pool):
+		self.evaporations += 1
+		if kernel is None:
+			def evaporate_tile(tile):
+				start, end, halo = tile
+				removed = []
+				for scent in (self.home[:, start:end], self.food[:, start:end]):
+					scent *= 1 - rate
+					removed.append(cut(scent, scent < CUTOFF))
+				return removed
+			removed = pool.map(evaporate_tile, tiles)
+			for mass, kind in ((self.home_mass, 0), (self.food_mass, 1)):
+				mass *= 1 - rate
+				mass -= sum(tile[kind] for tile in removed)
+			return self
+
+		kernel = numpy.asarray(kernel, numpy.float32)
+		home = numpy.empty_like(self.home)
+		food = numpy.empty_like(self.food)
+		def evaporate_tile(tile):
+			start, end, halo = tile
+			columns = numpy.arange(start - halo, end + halo) % self.width
+			for scent, result in ((self.home, home), (self.food, food)):
+				spread = self.diffuse(scent[:, columns], kernel, self.blocked[columns])[:, halo:halo + end - start]
+				spread *= 1 - rate
+				spread[spread < CUTOFF] = 0
+				result[:, start:end] = spread
+		pool.map(evaporate_tile, tiles)
+		self.home[...] = home
+		self.food[...] = food
+		self.home_mass = home.sum((1, 2), numpy.float64)
+		self.food_mass = food.sum((1, 2), numpy.float64)
+		return self
+
+	## Spreads scent to the neighbouring cells (the grid wraps around)
+	# @param scent The scent array to spread
+	# @param kernel Weights where kernel[i][j] is the share taken from the
+	# cell at offset (i-1, j-1)
+	# @param blocked The obstacles of the area the scent covers (the whole
+	# world by default)
+	# Obstacles never hold scent
+	def diffuse(self, scent, kernel, blocked=None):
+		kernel = numpy.asarray(kernel, numpy.float32)
+		rows, cols = kernel.shape
+		result = numpy.zeros_like(scent)
+		for i in xrange(rows):
+			for j in xrange(cols):
+				if kernel[i, j]:
+					shift = (rows/2 - i, cols/2 - j)
+					result += kernel[i, j] * numpy.roll(scent, shift, (1, 2))
+		result[:, self.blocked if blocked is None else blocked] = 0
+		return result
+
+class LazyScentField(ScentField):
+	"""
+	Scent field evaporating lazily
+	Every location remembers the tick of its last update, its scent is
+	only decayed (by the elapsed ticks at once, the cutoff applied after)
+	when it is read or written. A tick then only costs a counter update,
+	the whole field is brought up to date every "compact_every" ticks.
+	Reading it as a whole (rendering, metrics) decays a copy, so that
+	it does not change the rounding of the following ticks
+	Reads give the scent of the eager field, up to float rounding
+	A diffusion kernel spreads scent over the whole field, with one
+	every tick is eager
+	The total scent decays with every tick, the scent below the cutoff
+	is taken off when its location is brought up to date (so it is
+	counted until then, at most the cutoff per location)
+	"""
+	def __init__(self, nests, width, height, compact_every=100):
+		super(LazyScentField, self).__init__(nests, width, height)
+		self.compact_every = compact_every
+		self.rate = 0.
+		self.tick = 0
+		self.last = numpy.zeros((width, height), numpy.int64)
+
+	## Decays a scent value read at a location by the ticks elapsed
+	# since its last update
+	# @param scent The stored value
+	# @param x, y The location
+	def decayed(self, scent, x, y):
+		elapsed = self.tick - self.last.item(x, y)
+		if elapsed:
+			scent *= (1 - self.rate)**elapsed
+			if scent < CUTOFF:
+				return 0.
+		return scent
+
+	## Brings the scent of a single location up to date
+	# @param x, y The location
+	def settle_cell(self, x, y):
+		elapsed = self.tick - self.last.item(x, y)
+		if elapsed:
+			decay = (1 - self.rate)**elapsed
+			for scent, mass in ((self.home, self.home_mass), (self.food, self.food_mass)):
+				for id in xrange(self.nests):
+					value = scent.item(id, x, y)
+					if value:
+						value *= decay
+						if value < CUTOFF:
+							mass[id] -= value
+							value = 0
+						scent.itemset(id, x, y, value)
+			self.last.itemset(x, y, self.tick)
+		return self
+
+	## Brings the scent of some locations up to date
+	# @param xs, ys The locations (arrays, a location may be repeated)
+	def settle_cells(self, xs, ys):
+		elapsed = self.tick - self.last[xs, ys]
+		if numpy.any(elapsed):
+			for scent, mass in ((self.home, self.home_mass), (self.food, self.food_mass)):
+				values = scent[:, xs, ys]*(1 - self.rate)**elapsed
+				low = (values < CUTOFF) & (elapsed > 0)
+				removed = low & (values > 0)
+				if removed.any():
+					ids, positions = numpy.nonzero(removed.reshape(self.nests, -1))
+					cells = numpy.broadcast_to(xs*self.height + ys, elapsed.shape).ravel()[positions]
+					keys, first = numpy.unique(ids*self.width*self.height + cells, return_index=True)
+					lost = values.reshape(self.nests, -1)[ids[first], positions[first]]
+					mass -= numpy.bincount(ids[first], lost, self.nests)
+				values[low] = 0
+				scent[:, xs, ys] = values
+			self.last[xs, ys] = self.tick
+		return self
+
+	def settle(self):
+		"""
+		Brings the whole field up to date and clears the scent below
+		the cutoff (and sums the total scent again)
+		"""
+		elapsed = self.tick - self.last
+		if elapsed.any():
+			for scent in (self.home, self.food):
+				values = scent*(1 - self.rate)**elapsed
+				values[(values < CUTOFF) & (elapsed > 0)] = 0
+				scent[...] = values
+			self.last[...] = self.tick
+		return self.recount()
+
+	def settled(self):
+		"""
+		Returns up to date copies of the home and food scents, leaving
+		the field and the ticks of its locations untouched
+		"""
+		elapsed = self.tick - self.last
+		if not elapsed.any():
+			return self.home, self.food
+		return self.decay_copies(self.home, self.food, elapsed)
+
+	def settled_cells(self, xs, ys):
+		return self.decay_copies(self.home[:, xs, ys], self.food[:, xs, ys], self.tick - self.last[xs, ys])
+
+	## Returns decayed copies of scents
+	# @param home, food The stored scents
+	# @param elapsed The ticks since their locations were updated
+	def decay_copies(self, home, food, elapsed):
+		decay = (1 - self.rate)**elapsed
+		copies = []
+		for scent in (home, food):
+			values = scent*decay
+			values[(values < CUTOFF) & (elapsed > 0)] = 0
+			copies.append(values.astype(numpy.float32))
+		return copies
+
+	def get_home_scent(self, x, y, id):
+		return self.decayed(self.home.item(id, x, y), x, y)
+
+	def get_food_scent(self, x, y, id):
+		return self.decayed(self.food.item(id, x, y), x, y)
+
+	def get_scents(self, ids, xs, ys):
+		self.settle_cells(xs, ys)
+		return super(LazyScentField, self).get_scents(ids, xs, ys)
+
+	def get_max_home_scent(self, x, y):
+		return self.decayed(float(self.home[:, x, y].max()), x, y)
+
+	def get_max_food_scent(self, x, y):
+		return self.decayed(float(self.food[:, x, y].max()), x, y)
+
+	def add_home_scent(self, x, y, amt, id):
+		self.settle_cell(x, y)
+		return super(LazyScentField, self).add_home_scent(x, y, amt, id)
+
+	def add_food_scent(self, x, y, amt, id):
+		self.settle_cell(x, y)
+		return super(LazyScentField, self).add_food_scent(x, y, amt, id)
+
+	## Brings the 8 cells around a location up to date and adds scent to them
+	# (in one pass over the cells, see ScentField.spread_scent)
+	def spread_scent(self, x, y, home_amt, food_amt, id):
+		xs = (x + DX) % self.width
+		ys = (y + DY) % self.height
+		self.written[xs, ys] = True
+		elapsed = self.tick - self.last[xs, ys]
+		self.last[xs, ys] = self.tick
+		decay = (1 - self.rate)**elapsed
+		settled = elapsed > 0
+		blocked = self.blocked[xs, ys]
+		for scent, mass, amt in ((self.home, self.home_mass, home_amt), (self.food, self.food_mass, food_amt)):
+			values = scent[:, xs, ys]
+			values *= decay
+			mass -= values.sum(1, numpy.float64)
+			values[(values < CUTOFF) & settled] = 0
+			values[id] += amt
+			values[:, blocked] = 0
+			scent[:, xs, ys] = values
+			mass += values.sum(1, numpy.float64)
+		return self
+
+	def block(self, x, y):
+		self.settle_cell(x, y)
+		return super(LazyScentField, self).block(x, y)
+
+	def evaporate_cell(self, x, y, rate):
+		self.settle_cell(x, y)
+		return super(LazyScentField, self).evaporate_cell(x, y, rate)
+
+	## Counts a tick of evaporation, the decay is applied later
+	# @param rate The rate at which evaporation happens
+	# @param kernel Optional 3x3 diffusion kernel, evaporates eagerly
+	def evaporate(self, rate, kernel=None):
+		if kernel is not None or rate != self.rate:
+			self.settle()
+			self.rate = rate
+		if kernel is not None:
+			return super(LazyScentField, self).evaporate(rate, kernel)
+		self.evaporations += 1
+		self.tick += 1
+		self.home_mass *= 1 - rate
+		self.food_mass *= 1 - rate
+		if self.compact_every and self.tick % self.compact_every == 0:
+			self.settle()
+		return self
+
+## The thread pools evaporating tiles, by process and size (see tile_pool)
+TILE_POOLS = {}
+
+## Returns the thread pool evaporating a number of tiles
+# The pools are shared by all worlds of a process, so that creating
+# worlds (loading snapshots, seeking a replay, running a sweep) does not
+# leave threads behind, and are made again in a forked process, which
+# does not inherit their threads
+# @param size The number of threads
+def tile_pool(size):
+	key = (os.getpid(), size)
+	if key not in TILE_POOLS:
+		TILE_POOLS[key] = ThreadPool(size)
+	return TILE_POOLS[key]
+
+## Splits the columns of the world into tiles for evaporate_tiles
+# @param width The width of the world
+# @param count The number of tiles
+# @param halo The columns each tile reads on both sides of it (the
+# radius of the diffusion kernel)
+# Returns (start, end, halo) for every tile
+def make_tiles(width, count, halo=1):
+	count = max(1, min(count, width))
+	bounds = [width*i/count for i in xrange(count + 1)]
+	return [(start, end, halo) for start, end in zip(bounds, bounds[1:])]
@@ -0,0 +1,42 @@
+"""
+Batched sensing of the ants
+
+At the start of every tick the surroundings of all ants are read from
+the grids of the world in a single pass (see World.sense_ants). For
+every ant and each of the 8 cells around it (in the order of DIRECTIONS)
+the Senses hold whether the cell has
+	- FOOD : food, not in the nest of the ant
+	- OWN_HOME : the nest of the ant
+	- OBSTACLE : an obstacle
+	- OCCUPIED : an ant
+with the home and food scents of the colony of the ant there, and
+whether the ant stands in its own nest.
+
+The tasks decide from the senses (see Ant.sensed) instead of looking at
+the cells one by one, so what an ant senses is the world at the start
+of the tick. Actions (moving, taking food) still check the cells.
+"""
+import numpy
+
+FOOD, OWN_HOME, OBSTACLE, OCCUPIED = range(4)
+
+class Senses(object):
+	"""
+	What every ant senses around it, one row per ant
+	"""
+	def __init__(self, world, indices, nest_ids):
+		"""
+		"indices" are the flat indices of the cells of the ants and
+		"nest_ids" the ids of their nests
+		"""
+		indices = numpy.asarray(indices, numpy.int64)
+		nest_ids = numpy.asarray(nest_ids, numpy.int64)[:, None]
+		around = world.neighbours(indices)
+		self.cells = numpy.empty(around.shape + (4,), bool)
+		self.cells[..., OWN_HOME] = world.home_grid[around] == nest_ids
+		self.cells[..., FOOD] = (world.food_grid[around] > 0) & ~self.cells[..., OWN_HOME]
+		self.cells[..., OBSTACLE] = world.obstacle_grid[around]
+		self.cells[..., OCCUPIED] = world.occupancy[around] != -1
+		xs, ys = numpy.divmod(around, world.height)
+		self.home_scent, self.food_scent = world.scent.get_scents(nest_ids, xs, ys)
+		self.at_home = world.home_grid[indices] == nest_ids[:, 0]
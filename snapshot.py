@@ -0,0 +1,279 @@
+"""
+Binary snapshots of a World
+
+Layout of a snapshot file:
+	- the magic string "ANTSNAP1"
+	- the length of the header (8 bytes, little endian)
+	- the header, JSON describing the world and where each array is stored
+	- the arrays, raw and aligned to ALIGN bytes so that they can be
+	  memory-mapped when the snapshot is loaded
+"""
+import json
+import os
+import struct
+import cPickle as pickle
+from collections import OrderedDict
+
+import numpy
+from constants import SETTINGS
+from ants import QueenAnt, SoldierAnt, WorkerAnt
+from world import World, Nest
+from scent import LazyScentField
+
+MAGIC = "ANTSNAP1"
+VERSION = 3
+ALIGN = 64
+ANT_TYPES = (QueenAnt, SoldierAnt, WorkerAnt)
+
+## Rounds a size up to a multiple of ALIGN
+def align(size):
+	return (size + ALIGN - 1)//ALIGN*ALIGN
+
+## Returns the index of the type of an ant in ANT_TYPES
+def ant_type_index(ant):
+	for index, ant_type in enumerate(ANT_TYPES):
+		if isinstance(ant, ant_type):
+			return index
+	raise ValueError("Unknown type of ant %r" % ant)
+
+## Returns the arrays describing the cells, scent, ants and rng of a world
+# and the names of the tasks the ant_task array refers to
+def world_arrays(world):
+	shape = (world.width, world.height)
+	arrays = OrderedDict()
+	arrays["obstacle"] = world.obstacle_grid.reshape(shape)
+	arrays["food"] = world.food_grid.reshape(shape)
+	arrays["home"] = world.home_grid.reshape(shape)
+	arrays["scent_home"] = world.scent.home
+	arrays["scent_food"] = world.scent.food
+	if isinstance(world.scent, LazyScentField):
+		arrays["scent_last"] = world.scent.last
+
+	ids = list(world.ants)
+	ants = [world.ants[ant_id] for ant_id in ids]
+	task_names = sorted(set(ant.task_manager.active_task.name for ant in ants))
+	arrays["ant_id"] = numpy.array(ids, numpy.int64)
+	arrays["ant_type"] = numpy.array([ant_type_index(ant) for ant in ants], numpy.int8)
+	arrays["ant_nest"] = numpy.array([ant.get_nest_id() for ant in ants], numpy.int32)
+	arrays["ant_location"] = numpy.array([ant.get_location() for ant in ants], numpy.int32).reshape(-1, 2)
+	arrays["ant_direction"] = numpy.array([ant.direction for ant in ants], numpy.int8)
+	arrays["ant_food"] = numpy.array([ant.food for ant in ants], numpy.float64)
+	arrays["ant_health"] = numpy.array([ant.health for ant in ants], numpy.float64)
+	arrays["ant_food_scent_strength"] = numpy.array([ant.food_scent_strength for ant in ants], numpy.float64)
+	arrays["ant_home_scent_strength"] = numpy.array([ant.home_scent_strength for ant in ants], numpy.float64)
+	arrays["ant_task"] = numpy.array([task_names.index(ant.task_manager.active_task.name) for ant in ants], numpy.int16)
+	if world.population is not None:
+		arrays["ant_slot"] = numpy.array([ant.slot for ant in ants], numpy.int64)
+
+	arrays["occupancy"] = world.occupancy.reshape(shape)
+
+	arrays["rng_state"] = numpy.frombuffer(pickle.dumps(world.rng.getstate(), 2), numpy.uint8)
+	if world.stepper is not None:
+		states = [rng.getstate() for rng in world.stepper.rngs]
+		arrays["tile_rng_state"] = numpy.frombuffer(pickle.dumps(states, 2), numpy.uint8)
+	return arrays, task_names
+
+## Describes the lazy evaporation of a scent field, so that a restored
+# field decays and is compacted on the same ticks (the scent is saved as
+# it is stored, with the tick of the last update of every location)
+# @param scent The ScentField, None when it evaporates eagerly
+def scent_header(scent):
+	if not isinstance(scent, LazyScentField):
+		return None
+	return {"tick": scent.tick, "rate": scent.rate}
+
+## Gives a world the scent of a snapshot
+# A lazy snapshot restored into an eager field is brought up to date
+# @param world The world
+# @param header The header of the snapshot
+# @param array The function returning an array of the snapshot by name
+def restore_scent(world, header, array):
+	home = array("scent_home")
+	food = array("scent_food")
+	info = header.get("scent")
+	if info is not None:
+		if isinstance(world.scent, LazyScentField):
+			scent = world.scent
+		else:
+			scent = LazyScentField(home.shape[0], world.width, world.height)
+		scent.home = home
+		scent.food = food
+		scent.last = numpy.array(array("scent_last"))
+		scent.tick = info["tick"]
+		scent.rate = info["rate"]
+		if scent is not world.scent:
+			home, food = scent.settled()
+	world.scent.home = home
+	world.scent.food = food
+	world.scent.nests = home.shape[0]
+	world.scent.recount()
+
+## Describes the slots of a population, so that a restored
+# population steps its ants in the same order
+# @param population The Population, or None when ants are objects
+def population_header(population):
+	if population is None:
+		return None
+	return {
+		"size": population.size,
+		"free": population.free,
+	}
+
+## Gives a new population the slots of a saved one
+# The slots of the saved ants are handed out in the order they are created
+# @param population The empty Population
+# @param info The population header
+# @param slots The slots of the saved ants
+def restore_population(population, info, slots):
+	while population.capacity < info["size"]:
+		population.grow()
+	population.free = slots[::-1]
+	population.size = info["size"]
+
+## Writes a snapshot of the full state of a world into an open file
+# @param world The world (between two ticks)
+# @param stream The file, the snapshot starts at its current position
+# Returns the size of the snapshot in bytes
+def write_world(world, stream):
+	arrays, task_names = world_arrays(world)
+
+	offset = 0
+	layout = {}
+	for name, array in arrays.items():
+		layout[name] = {"dtype": array.dtype.str, "shape": array.shape, "offset": offset}
+		offset = align(offset + array.nbytes)
+
+	header = json.dumps({
+		"version": VERSION,
+		"width": world.width,
+		"height": world.height,
+		"lifecycle": world.lifecycle.state(),
+		"settings": world.settings,
+		"task_names": task_names,
+		"ant_types": [ant_type.__name__ for ant_type in ANT_TYPES],
+		"nests": [{
+			"id": nest.id,
+			"size": list(nest.size),
+			"location": list(nest.location),
+			"ant_count": [[ant_type.__name__, count] for ant_type, count in nest.ant_count.items()],
+		} for nest in world.nests.values()],
+		"population": population_header(world.population),
+		"scent": scent_header(world.scent),
+		"arrays": layout,
+	})
+
+	start = stream.tell()
+	stream.write(MAGIC)
+	stream.write(struct.pack("<Q", len(header)))
+	stream.write(header)
+	data_start = start + align(len(MAGIC) + 8 + len(header))
+	for name, array in arrays.items():
+		stream.seek(data_start + layout[name]["offset"])
+		stream.write(numpy.ascontiguousarray(array).tostring())
+	return stream.tell() - start
+
+## Writes a snapshot of the full state of a world
+# @param world The world (between two ticks)
+# @param path The file to write, replaced atomically
+def save_world(world, path):
+	temporary_path = path + ".tmp"
+	with open(temporary_path, "wb") as snapshot:
+		write_world(world, snapshot)
+	os.rename(temporary_path, path)
+
+## Reads the header of a snapshot
+# @param path The file holding the snapshot
+# @param offset The position of the snapshot in the file
+# Returns the header and the position of the first array in the file
+def read_header(path, offset=0):
+	with open(path, "rb") as snapshot:
+		snapshot.seek(offset)
+		if snapshot.read(len(MAGIC)) != MAGIC:
+			raise ValueError("%s is not a world snapshot" % path)
+		length, = struct.unpack("<Q", snapshot.read(8))
+		header = json.loads(snapshot.read(length))
+	if header["version"] != VERSION:
+		raise ValueError("%s is a snapshot of version %d, expected %d" % (path, header["version"], VERSION))
+	return header, offset + align(len(MAGIC) + 8 + length)
+
+## Opens the arrays of a snapshot
+# @param path The file holding the snapshot
+# @param offset The position of the snapshot in the file
+# Returns the header and a function returning an array by name,
+# memory-mapped copy-on-write
+def open_arrays(path, offset=0):
+	header, data_start = read_header(path, offset)
+
+	def array(name):
+		info = header["arrays"][name]
+		shape = tuple(info["shape"])
+		if not numpy.prod(shape):
+			return numpy.zeros(shape, info["dtype"])
+		return numpy.memmap(path, info["dtype"], "c", data_start + info["offset"], shape)
+	return header, array
+
+## Restores a world from a snapshot
+# The arrays are memory-mapped copy-on-write: the scent fields are used
+# as they are, the obstacle, food and home grids are copied and only the
+# ants are rebuilt
+# @param path The snapshot file
+# @param images The images of the simulation
+# @param settings Settings overriding the saved ones (eg. "render_mode")
+# @param offset The position of the snapshot in the file
+def load_world(path, images, settings=None, offset=0):
+	header, array = open_arrays(path, offset)
+
+	world_settings = dict(SETTINGS)
+	world_settings.update(header["settings"])
+	world_settings.update(settings or {})
+	world = World(header["width"], header["height"], images, world_settings, generate=False)
+	world.rng.setstate(pickle.loads(array("rng_state").tostring()))
+	if world.stepper is not None and "tile_rng_state" in header["arrays"]:
+		states = pickle.loads(array("tile_rng_state").tostring())
+		if len(states) == len(world.stepper.rngs):
+			for rng, state in zip(world.stepper.rngs, states):
+				rng.setstate(state)
+
+	restore_scent(world, header, array)
+	obstacle = array("obstacle")
+	world.scent.blocked = numpy.array(obstacle)
+	world.obstacle_grid[...] = obstacle.ravel()
+	world.food_grid[...] = array("food").ravel()
+
+	ant_types = dict((ant_type.__name__, ant_type) for ant_type in ANT_TYPES)
+	for info in header["nests"]:
+		nest = Nest(world, info["id"], info["size"], tuple(info["location"]), {})
+		nest.ant_count = OrderedDict((ant_types[name], count) for name, count in info["ant_count"])
+		world.nests[nest.id] = nest
+	world.home_grid[...] = array("home").ravel()
+
+	restored = world.population is not None and header["population"] is not None
+	if restored:
+		restore_population(world.population, header["population"], array("ant_slot").tolist())
+		free = list(header["population"]["free"])
+
+	columns = zip(
+		array("ant_id").tolist(), array("ant_type").tolist(), array("ant_nest").tolist(),
+		array("ant_location").tolist(), array("ant_direction").tolist(), array("ant_food").tolist(),
+		array("ant_health").tolist(), array("ant_food_scent_strength").tolist(),
+		array("ant_home_scent_strength").tolist(), array("ant_task").tolist())
+	for ant_id, type_index, nest_id, location, direction, food, health, food_scent, home_scent, task in columns:
+		ant_type = world.ant_class(ant_types[header["ant_types"][type_index]])
+		ant = ant_type(world, images.get("ant"), direction, tuple(location), world.nests[nest_id])
+		ant.food = food
+		ant.health = health
+		ant.food_scent_strength = food_scent
+		ant.home_scent_strength = home_scent
+		ant.task_manager.set_active_task(header["task_names"][task])
+		ant.id = ant_id
+		if world.population is not None:
+			world.population.set_task(ant.slot, ant.task_manager.active_task)
+		world.ants[ant_id] = ant
+		world.spatial.add(ant)
+
+	if restored:
+		world.population.free = free
+
+	world.occupancy[...] = array("occupancy").ravel()
+	world.lifecycle.set_state(header["lifecycle"])
+	return world
@@ -0,0 +1,137 @@
+"""
+Spatial index of the ants of a world, by nest and region
+
+The grid is split into square regions of region_size x region_size
+cells. Every nest keeps the ants it has in every region, so that
+finding the ants of the other nests around a cell only looks at the
+regions the search reaches, and counting the ants of a nest in a region
+is a single lookup.
+
+The index is told about every birth and death as a listener of the
+Lifecycle, and about every move by Ant.move (World.spatial.update).
+"""
+
+class SpatialIndex(object):
+	"""
+	The ants of every nest in every region
+	Regions are numbered column after column, like the cells
+	"""
+	def __init__(self, world, region_size):
+		self.world = world
+		self.width = world.width
+		self.height = world.height
+		self.region_size = region_size
+		self.columns = -(-self.width//region_size)
+		self.rows = -(-self.height//region_size)
+		## The first region of every column of cells and the region offset
+		# of every row (a cell is in the sum of both)
+		self.column_regions = [x//region_size*self.rows for x in xrange(self.width)]
+		self.row_regions = [y//region_size for y in xrange(self.height)]
+		## nest id -> region -> ant id -> ant (empty regions are dropped)
+		self.buckets = {}
+		## ant id -> region the ant is filed under
+		self.regions = {}
+
+	## Returns the region of a cell
+	# @param index The flat index of the cell
+	def region(self, index):
+		x, y = divmod(index, self.height)
+		return self.column_regions[x] + self.row_regions[y]
+
+	## Files a new ant under its region
+	# @param ant The ant, with its id
+	def add(self, ant):
+		region = self.region(ant.index)
+		self.regions[ant.id] = region
+		self.buckets.setdefault(ant.get_nest_id(), {}).setdefault(region, {})[ant.id] = ant
+
+	## Forgets an ant
+	# @param ant The ant
+	def remove(self, ant):
+		region = self.regions.pop(ant.id, None)
+		if region is None:
+			return
+		regions = self.buckets[ant.get_nest_id()]
+		bucket = regions[region]
+		del bucket[ant.id]
+		if not bucket:
+			del regions[region]
+
+	## Files an ant under its new region after it moved
+	# (only does something when it left its region)
+	# @param ant The ant
+	def update(self, ant):
+		region = self.region(ant.index)
+		old_region = self.regions[ant.id]
+		if region == old_region:
+			return
+		regions = self.buckets[ant.get_nest_id()]
+		bucket = regions[old_region]
+		del bucket[ant.id]
+		if not bucket:
+			del regions[old_region]
+		regions.setdefault(region, {})[ant.id] = ant
+		self.regions[ant.id] = region
+
+	def ant_born(self, ant):
+		self.add(ant)
+
+	def ant_died(self, ant):
+		self.remove(ant)
+
+	## Returns the region columns or rows a range of cells around a
+	# coordinate reaches on the wrapping grid
+	# @param center The coordinate
+	# @param radius The distance from the coordinate
+	# @param length The width or height of the grid
+	# @param count The number of region columns or rows
+	def spans(self, center, radius, length, count):
+		if 2*radius + 1 >= length:
+			return range(count)
+		size = self.region_size
+		first = (center - radius) % length
+		last = (center + radius) % length
+		if first <= last:
+			return range(first//size, last//size + 1)
+		spans = range(first//size, count)
+		for span in range(0, last//size + 1):
+			if span not in spans:
+				spans.append(span)
+		return spans
+
+	## Returns the ants of the other nests within a distance of a cell,
+	# by id (so that the order does not depend on the order the ants
+	# were filed in, which differs in a world loaded from a snapshot)
+	# The distance is the number of moves between two cells (diagonal
+	# moves included) on the wrapping grid
+	# @param index The flat index of the cell
+	# @param nest_id The id of the nest whose ants are left out
+	# @param radius The distance
+	def enemies_within(self, index, nest_id, radius):
+		x, y = divmod(index, self.height)
+		width, height = self.width, self.height
+		regions = [column*self.rows + row
+			for column in self.spans(x, radius, width, self.columns)
+			for row in self.spans(y, radius, height, self.rows)]
+		found = []
+		for other_id, buckets in self.buckets.items():
+			if other_id == nest_id:
+				continue
+			for region in regions:
+				bucket = buckets.get(region)
+				if bucket is None:
+					continue
+				for ant in bucket.itervalues():
+					dx, dy = divmod(ant.index, height)
+					dx = abs(dx - x)
+					dy = abs(dy - y)
+					if min(dx, width - dx) <= radius and min(dy, height - dy) <= radius:
+						found.append(ant)
+		found.sort(key=lambda ant: ant.id)
+		return found
+
+	## Returns the number of ants of a nest in the region of a cell
+	# @param nest_id The id of the nest
+	# @param index The flat index of a cell of the region
+	def count_in_region(self, nest_id, index):
+		return len(self.buckets.get(nest_id, {}).get(self.region(index), ()))
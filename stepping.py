@@ -0,0 +1,348 @@
+"""
+Parallel stepping of the ants, tile by tile
+
+With the "step_tiles" setting (and the population stored in arrays) the
+columns of the world are split into tiles and the ants of every tile
+perform their tasks on a worker process of the tile. The workers are
+forked once and fed every tick through a pipe:
+	- the population, the grids, the scent (and the scent locations
+	  written, see ScentOverlay), the senses of the tick and the
+	  distance fields of the navigation are in shared memory, the
+	  workers read them and write them directly
+	- a tile only steps the ants at least HALO columns away from its
+	  borders whose task only touches the cells around them (Task.local):
+	  all they read and write is in the tile, no two workers touch the
+	  same cell or the same slot
+	- the other ants (near a border, producing ants or guarding the
+	  nest) are stepped by the world once the workers are done, one
+	  after another
+	- every tile draws from its own random stream, seeded from the seed
+	  of the world and the tile, the other ants from the world rng
+A worker only reports what changed on the slots it stepped and outside
+the shared memory (the ants that moved, carried food or died, the food
+of the nests, the total scent, the cells to redraw, the tasks asked for),
+applied in the order of the tiles, so a run only depends on its seed and
+number of tiles, never on how the workers are scheduled. The costs of
+the tasks and the switches are then applied as in Population.step.
+
+The rest of the world a worker sees is the copy it was forked with. It
+is told about the ants born since the previous tick (see
+Population.adopt), leaves the spatial index and the navigation to the
+world, and is forked again when a shared array was replaced (the
+population grew, the navigation was rebuilt, a snapshot was loaded) or
+a recorder was attached or detached.
+"""
+import mmap
+import signal
+import traceback
+from multiprocessing import Process, Pipe
+
+import numpy
+from rng import make_stream_rng
+from scent import LazyScentField, make_tiles
+from task_manager import TASKS
+
+## Columns between a tile border and the ants stepped by the tile: an ant
+# moves one cell and spreads scent around the cell it moved to
+HALO = 2
+## The arrays of World.senses
+SENSES = ("cells", "home_scent", "food_scent", "at_home")
+
+## Returns a copy of an array in memory shared with the processes
+# forked afterwards
+# @param array The array
+def shared_copy(array):
+	memory = mmap.mmap(-1, max(array.nbytes, 1))
+	copy = numpy.frombuffer(memory, array.dtype, array.size).reshape(array.shape)
+	copy[...] = array
+	return copy
+
+class NavigationView(object):
+	"""
+	The navigation of the world as seen by a worker: it turns the ants,
+	the world keeps the fields up to date (see TiledStepper.food_changed)
+	"""
+	def __init__(self, navigation):
+		self.navigation = navigation
+
+	def home_turn(self, ant):
+		return self.navigation.home_turn(ant)
+
+	def food_turn(self, ant):
+		return self.navigation.food_turn(ant)
+
+	def food_added(self, cell):
+		pass
+
+	def food_removed(self, cell):
+		pass
+
+class SpatialView(object):
+	"""
+	The spatial index of the world as seen by a worker: the world files
+	the ants that moved once the tile is merged (see TiledStepper.merge)
+	"""
+	def update(self, ant):
+		pass
+
+class TiledStepper(object):
+	"""
+	Steps the ants of the population of a world on one worker process
+	per tile (World.stepper)
+	"""
+	def __init__(self, world, count):
+		self.world = world
+		self.tiles = make_tiles(world.width, count, HALO)
+		self.starts = numpy.array([start for start, end, halo in self.tiles])
+		self.ends = numpy.array([end for start, end, halo in self.tiles])
+		self.local = numpy.array([task.local for task in TASKS], bool)
+		self.rngs = [make_stream_rng(world.settings, tile) for tile in xrange(len(self.tiles))]
+		self.shared = {}
+		## (process, connection) of every tile, empty until the first step
+		self.workers = []
+		## Whether the workers were forked with a recorder attached
+		self.recording = None
+		## The ant of every slot, as the workers know them
+		self.known = []
+
+	def share(self):
+		"""
+		Moves the arrays read or written by the workers into shared
+		memory (again when one was replaced, eg. by loading a snapshot)
+		and copies the senses of the tick there
+		Returns whether an array was moved
+		"""
+		world = self.world
+		population = world.population
+		arrays = [("occupancy", world, "occupancy"), ("food_grid", world, "food_grid"),
+			("obstacle_grid", world, "obstacle_grid"), ("home_grid", world, "home_grid"),
+			("home", world.scent, "home"), ("food", world.scent, "food"),
+			("written", world.scent, "written"), ("blocked", world.scent, "blocked")]
+		if isinstance(world.scent, LazyScentField):
+			arrays.append(("last", world.scent, "last"))
+		for name, dtype in population.FIELDS:
+			arrays.append(("population." + name, population, name))
+		if world.navigation is not None:
+			for kind, fields in (("home", world.navigation.home), ("food", world.navigation.food)):
+				for nest_id, field in fields.items():
+					arrays.append(("navigation.%s.%d" % (kind, nest_id), field, "distance"))
+
+		moved = False
+		shared = {}
+		for key, owner, name in arrays:
+			array = getattr(owner, name)
+			if self.shared.get(key) is not array:
+				array = shared_copy(array)
+				setattr(owner, name, array)
+				moved = True
+			shared[key] = array
+
+		senses = world.senses
+		for name in SENSES:
+			array = getattr(senses, name)
+			key = "senses." + name
+			buffer = self.shared.get(key)
+			if buffer is None or len(buffer) < len(array) or buffer.shape[1:] != array.shape[1:] or buffer.dtype != array.dtype:
+				buffer = shared_copy(numpy.zeros((population.capacity,) + array.shape[1:], array.dtype))
+				moved = True
+			buffer[:len(array)] = array
+			setattr(senses, name, buffer[:len(array)])
+			shared[key] = buffer
+		self.shared = shared
+		return moved
+
+	def start(self):
+		"""
+		Forks a worker for every tile (stopping the previous ones)
+		"""
+		self.stop()
+		self.recording = self.world.recorder is not None
+		self.known = list(self.world.population.ants)
+		for tile in xrange(len(self.tiles)):
+			connection, remote = Pipe()
+			worker = Process(target=self.serve, args=(tile, remote))
+			worker.daemon = True
+			worker.start()
+			remote.close()
+			self.workers.append((worker, connection))
+
+	def stop(self):
+		"""
+		Stops the workers
+		"""
+		for worker, connection in self.workers:
+			try:
+				connection.send(None)
+			except IOError:
+				pass
+			connection.close()
+			worker.join()
+		self.workers = []
+
+	## Splits the living ants between the tiles
+	# @param slots The slots of the living ants
+	# @param tasks The tasks of all slots
+	# Returns the slots stepped by every tile and the slots stepped by
+	# the world
+	def split(self, slots, tasks):
+		xs = self.world.population.x[slots]
+		tiles = numpy.searchsorted(self.starts, xs, "right") - 1
+		inner = (xs >= self.starts[tiles] + HALO) & (xs < self.ends[tiles] - HALO) & self.local[tasks[slots]]
+		return [slots[inner & (tiles == tile)] for tile in xrange(len(self.tiles))], slots[~inner]
+
+	## Returns the ants born since the workers last heard of the slots,
+	# as (slot, ant type, nest id)
+	def births(self):
+		population = self.world.population
+		types = dict((proxy, ant_type) for ant_type, proxy in population.proxy_classes.items())
+		born = []
+		for slot, ant in enumerate(population.ants):
+			if ant is not self.known[slot]:
+				if ant is not None:
+					born.append((slot, types[type(ant)], ant.get_nest_id()))
+				self.known[slot] = ant
+		return born
+
+	## Advances all ants of the population by one step
+	# @param profiler Optional Profiler, only the ants stepped by the
+	# world are recorded task by task
+	def step(self, profiler=None):
+		world = self.world
+		population = world.population
+		size = population.size
+		tasks = population.task[:size].copy()
+		slots = numpy.flatnonzero(population.alive[:size])
+		groups, rest = self.split(slots, tasks)
+
+		if world.navigation is not None:
+			world.navigation.fields()
+		if self.share() or self.recording != (world.recorder is not None) or not self.workers:
+			self.start()
+		food = world.food_grid.copy() if world.navigation is not None else None
+		scent = (world.scent.tick, world.scent.rate) if isinstance(world.scent, LazyScentField) else None
+		births = self.births()
+
+		for (worker, connection), group in zip(self.workers, groups):
+			connection.send((group, births, scent))
+
+		switches = []
+		failure = None
+		for tile, (worker, connection) in enumerate(self.workers):
+			try:
+				result = connection.recv()
+			except EOFError:
+				result = "the worker exited without a result"
+			if isinstance(result, basestring):
+				failure = failure or "Stepping tile %d failed:\n%s" % (tile, result)
+			elif failure is None:
+				switches.extend(self.merge(tile, result))
+		if failure is not None:
+			self.stop()
+			raise RuntimeError(failure)
+		if food is not None:
+			self.food_changed(food)
+
+		switches.extend(population.perform(rest, tasks, profiler))
+		population.apply_costs(slots, tasks)
+		population.apply_switches(switches, profiler)
+		return self
+
+	## Runs the steps of a tile sent by the world until it is stopped
+	# (on the worker process, which leaves an interrupt to the world and
+	# does not keep the handlers pygame may have installed, so that
+	# multiprocessing can terminate it at exit)
+	# @param tile The number of the tile
+	# @param connection The end of the pipe of the tile
+	def serve(self, tile, connection):
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		world = self.world
+		world.rng = self.rngs[tile]
+		world.spatial = SpatialView()
+		for name in SENSES:
+			setattr(world.senses, name, self.shared["senses." + name])
+		if world.navigation is not None:
+			world.navigation = NavigationView(world.navigation)
+		while True:
+			try:
+				message = connection.recv()
+			except EOFError:
+				break
+			if message is None:
+				break
+			try:
+				connection.send(self.run_tile(*message))
+			except Exception:
+				connection.send(traceback.format_exc())
+		connection.close()
+
+	## Steps the ants of a tile (on the worker process)
+	# @param slots The slots of its ants
+	# @param births The ants born since the previous step (see births)
+	# @param scent The tick and the evaporation rate of a lazy scent
+	# field, None for an eager one
+	# Returns what changed outside the shared memory
+	def run_tile(self, slots, births, scent):
+		world = self.world
+		population = world.population
+		for slot, ant_type, nest_id in births:
+			population.adopt(ant_type, slot, world, world.nests[nest_id])
+		if scent is not None:
+			world.scent.tick, world.scent.rate = scent
+		world.dirty = set()
+		if world.recorder is not None:
+			world.recorder.touched = set()
+		home_mass = world.scent.home_mass.copy()
+		food_mass = world.scent.food_mass.copy()
+		nest_food = dict((nest_id, nest.food) for nest_id, nest in world.nests.items())
+		index = population.index[slots]
+		food = population.food[slots]
+		health = population.health[slots]
+
+		switches = [(ant.slot, new_task) for ant, new_task in population.perform(slots, population.task)]
+		moved = slots[population.index[slots] != index]
+		nests = population.nest[slots]
+		carried = numpy.bincount(nests, population.food[slots] - food, len(world.nests))
+		dying = slots[(health >= 0) & (population.health[slots] < 0)]
+		nest_food = dict((nest_id, nest.food - nest_food[nest_id]) for nest_id, nest in world.nests.items())
+		mass = (world.scent.home_mass - home_mass, world.scent.food_mass - food_mass)
+		touched = set(world.dirty)
+		if world.recorder is not None:
+			touched.update(world.recorder.touched)
+		return world.rng.getstate(), switches, moved, carried, dying, nest_food, mass, list(touched)
+
+	## Applies the result of a worker
+	# @param tile The number of the tile
+	# @param result The result of run_tile
+	# Returns the (ant, new task id) pairs of the ants asking for a new task
+	def merge(self, tile, result):
+		world = self.world
+		population = world.population
+		rng_state, switches, moved, carried, dying, nest_food, mass, touched = result
+		self.rngs[tile].setstate(rng_state)
+		if world.metrics is not None:
+			for nest_id, amount in enumerate(carried.tolist()):
+				if amount:
+					world.metrics.food_carried(nest_id, amount)
+		for slot in moved.tolist():
+			world.spatial.update(population.ants[slot])
+		if world.lifecycle is not None:
+			for slot in dying.tolist():
+				world.lifecycle.queue_death(population.ants[slot])
+		for nest_id, amount in nest_food.items():
+			world.nests[nest_id].food += amount
+		world.scent.home_mass += mass[0]
+		world.scent.food_mass += mass[1]
+		for location in touched:
+			world.mark_dirty(location)
+		return [(population.ants[slot], new_task) for slot, new_task in switches]
+
+	## Tells the navigation about the cells whose food ran out or appeared
+	# on the workers
+	# @param food The food grid before the step
+	def food_changed(self, food):
+		world = self.world
+		for index in numpy.flatnonzero((food > 0) & (world.food_grid == 0)).tolist():
+			world.navigation.food_removed(world.cells[index])
+		for index in numpy.flatnonzero((food == 0) & (world.food_grid > 0)).tolist():
+			world.navigation.food_added(world.cells[index])
@@ -0,0 +1,142 @@
+"""
+Runs headless simulations over a grid of settings and seeds in parallel
+and streams the metrics of every run to a JSON lines file
+
+	python sweep.py --set "evaporation_rate=[0.01, 0.03, 0.05]" --set "ant_mix=[[94, 5, 1], [80, 15, 5]]" --seeds 8
+	python sweep.py --grid grid.json --ticks 5000 --sample-every 250 -o sweep.jsonl
+
+Every combination of the grid values is run once per seed, each run in
+its own World on a process pool. The workers never open a display or
+load images, so no pygame state is shared between them.
+"""
+import itertools
+import json
+import sys
+from argparse import ArgumentParser
+from multiprocessing import Pool, cpu_count
+from timeit import default_timer
+
+from constants import SETTINGS
+from world import World
+
+def parse_args():
+	parser = ArgumentParser(description="Parameter sweep of the ant simulation")
+	parser.add_argument("--grid", metavar="FILE",
+		help="JSON object mapping setting names to lists of values")
+	parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUES",
+		help="values of a setting as a JSON list (can be repeated)")
+	parser.add_argument("--seeds", type=int, default=4, help="number of seeds per combination")
+	parser.add_argument("--first-seed", type=int, default=0)
+	parser.add_argument("--ticks", type=int, default=2000, help="ticks simulated per run")
+	parser.add_argument("--sample-every", type=int, default=100, metavar="TICKS",
+		help="ticks between two samples of the metrics")
+	parser.add_argument("--size", default="130x70", help="size of the worlds (WIDTHxHEIGHT)")
+	parser.add_argument("--processes", type=int, default=cpu_count())
+	parser.add_argument("-o", "--output", default="sweep.jsonl")
+	return parser.parse_args()
+
+## Reads the grid of settings from the options
+# Returns an ordered list of (name, values) pairs
+def read_grid(options):
+	grid = {}
+	if options.grid:
+		with open(options.grid) as grid_file:
+			grid.update(json.load(grid_file))
+	for assignment in options.set:
+		name, values = assignment.split("=", 1)
+		grid[name.strip()] = json.loads(values)
+	for name, values in grid.items():
+		if name not in SETTINGS:
+			raise ValueError("Unknown setting %r" % name)
+		if not isinstance(values, list) or not values:
+			raise ValueError("The values of %r must be a non empty list" % name)
+	return sorted(grid.items())
+
+## Lists the runs of a sweep, one per combination of values and seed
+# @param grid The (name, values) pairs
+# @param seeds The seeds every combination is run with
+# @param ticks, sample_every, size As in run_simulation
+def make_jobs(grid, seeds, ticks, sample_every, size):
+	names = [name for name, values in grid]
+	jobs = []
+	for combination in itertools.product(*[values for name, values in grid]):
+		for seed in seeds:
+			settings = dict(zip(names, combination))
+			settings["seed"] = seed
+			jobs.append({
+				"run": len(jobs),
+				"settings": settings,
+				"ticks": ticks,
+				"sample_every": sample_every,
+				"size": size,
+			})
+	return jobs
+
+def sample(world):
+	"""
+	Returns the metrics of a world at the current tick
+		- the living ants of every nest
+		- the food stored in every nest
+		- the ants of every nest that died since the start
+	"""
+	population = dict((id, 0) for id in world.nests)
+	for ant in world.ants.values():
+		population[ant.get_nest_id()] += 1
+	return {
+		"population": [population[id] for id in sorted(population)],
+		"food": [world.nests[id].food for id in sorted(world.nests)],
+		"deaths": [world.lifecycle.deaths.get(id, 0) for id in sorted(world.nests)],
+	}
+
+## Runs one simulation of a sweep (in a worker process)
+# @param job A job made by make_jobs
+# Returns the job with the sampled metrics and the speed of the run
+def run_simulation(job):
+	settings = dict(SETTINGS)
+	settings.update(job["settings"])
+	settings["render_mode"] = "none"
+	width, height = job["size"]
+
+	start = default_timer()
+	world = World(width, height, {}, settings)
+	samples = []
+	for tick in xrange(1, job["ticks"] + 1):
+		world.advance()
+		if tick % job["sample_every"] == 0 or tick == job["ticks"]:
+			metrics = sample(world)
+			metrics["tick"] = tick
+			samples.append(metrics)
+	elapsed = default_timer() - start
+
+	result = dict(job)
+	result["samples"] = samples
+	result["ticks_per_second"] = job["ticks"]/elapsed if elapsed else float("inf")
+	return result
+
+## Runs all jobs on a process pool, writing every result as soon as it is done
+# @param jobs The jobs made by make_jobs
+# @param output The JSON lines file the results are written to
+# @param processes The number of worker processes
+def sweep(jobs, output, processes):
+	pool = Pool(processes)
+	try:
+		with open(output, "w") as results:
+			for done, result in enumerate(pool.imap_unordered(run_simulation, jobs), 1):
+				results.write(json.dumps(result) + "\n")
+				results.flush()
+				print "[%d/%d] run %d %s: %.1f ticks per second" % (
+					done, len(jobs), result["run"], json.dumps(result["settings"], sort_keys=True), result["ticks_per_second"])
+				sys.stdout.flush()
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+
+if __name__ == '__main__':
+	options = parse_args()
+	size = tuple(int(n) for n in options.size.split("x"))
+	seeds = range(options.first_seed, options.first_seed + options.seeds)
+	jobs = make_jobs(read_grid(options), seeds, options.ticks, options.sample_every, size)
+	sweep(jobs, options.output, max(1, options.processes))
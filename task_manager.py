@@ -1,83 +1,121 @@
-from random import randint, choice
+from sensing import FOOD, OWN_HOME, OBSTACLE, OCCUPIED
 
-class TaskManager():
+## Ids of the tasks, their positions in TASKS
+EXPLORE, TAKE_FOOD, DROP_FOOD, FOLLOW_FOOD_TRAIL, FOLLOW_HOME_TRAIL, RETURN_HOME, GUARD_NEST, PRODUCE_ANTS, FIND_FOOD = range(9)
+
+class TaskManager(object):
 	"""
-	Decides and performs all actions of an Ant
+	Keeps track of the active task of an Ant
+	The tasks are shared by all ants (see TASKS), they are performed by
+	World.step_ants or Population.step
 	"""
-	def __init__(self):
-		self.tasks = {}
-		self.active_task = None
-
-	def add_task(self, task):
-		"""
-		Adds a new task
-		"""
-		self.tasks[task.name] = task
-
-	def make_decision(self):
-		"""
-		Performs the active task
-		Checks for new task
-		If new task is present end the current task and
-		start the new task
-		"""
-		self.active_task.perform_task()
+	__slots__ = ("ant", "tasks", "transitions", "active_task")
 
-		new_task = self.active_task.get_new_task()
+	## @param ant The ant
+	# @param tasks The tasks the ant can perform, by name
+	# @param transitions The transition table of the type of the ant
+	# (see transition_table)
+	def __init__(self, ant, tasks, transitions):
+		self.ant = ant
+		self.tasks = tasks
+		self.transitions = transitions
+		self.active_task = None
 
-		if new_task:
-			self.active_task.end_task()
-			self.set_active_task(new_task)
-			self.active_task.start_task()
+	## Ends the active task and starts a new one (and tells the metrics
+	# of the world, if some are attached)
+	# @param new_task The id of the new task, the active task goes on if None
+	# Returns True if the task changed
+	# Raises ValueError if the type of the ant has no such transition
+	def switch_task(self, new_task):
+		if new_task is not None:
+			old_task = self.active_task
+			try:
+				task = self.transitions[old_task.id][new_task]
+			except KeyError:
+				raise ValueError("%s can not switch from %s to task %d" % (type(self.ant).__name__, old_task.name, new_task))
+			old_task.end_task(self.ant)
+			self.active_task = task
+			task.start_task(self.ant)
+			metrics = self.ant.world.metrics
+			if metrics is not None:
+				metrics.task_switched(self.ant, old_task, task)
+			return True
+		return False
 
 	def set_active_task(self, task_name):
 		"""
-		Sets the active task
+		Sets the active task by name
 		"""
 		self.active_task = self.tasks[task_name]
 
+## Returns the tasks of a type of ant by name
+# @param task_types The Task subclasses
+def task_table(*task_types):
+	return dict((task_type.name, TASKS[task_type.id]) for task_type in task_types)
+
+## Returns the transitions allowed to a type of ant: for every task id,
+# the tasks it can switch to by id (only the tasks of the type, empty for
+# the tasks the type does not have)
+# @param tasks The tasks of the type by name (see task_table)
+def transition_table(tasks):
+	ids = set(task.id for task in tasks.values())
+	table = [{} for task in TASKS]
+	for task in tasks.values():
+		table[task.id] = dict((next_id, TASKS[next_id]) for next_id in task.transitions if next_id in ids)
+	return table
+
 class Task(object):
 	"""
 	Base class for a Task
+	Tasks hold no state, a single instance of each is shared by all
+	ants and is given the ant it acts for
+	Every time a task is performed the ant loses health_cost health and
+	its scent strengths fade if fades_scent is set, both applied to all
+	ants at once (see World.apply_task_costs and Population.step)
 	"""
-	def __init__(self, name, ant):
-		self.name = name
-		self.ant = ant
-		self.new_task = None
-
-	def start_task(self):
+	__slots__ = ()
+	id = None
+	name = None
+	## Health lost each time the task is performed
+	health_cost = .001
+	## Whether performing the task fades the scent strengths of the ant
+	fades_scent = False
+	## Whether the task only touches the cells around the ant (and the
+	# ants on them), so that it can be performed on a tile (see stepping.py)
+	local = True
+	## Ids of the tasks perform_task may switch to
+	transitions = ()
+
+	def start_task(self, ant):
 		"""
 		Actions at the beginning of a new task
 		"""
 		pass
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""
 		Actions done for a task
-		each time a task is performed reduce the health by one
+		Returns the id of the task to switch to, None to go on
 		"""
-		self.ant.reduce_health(.001)
+		return None
 
-	def end_task(self):
+	def end_task(self, ant):
 		"""
 		Actions at the end of a new task
 		"""
 		pass
 
-	def get_new_task(self):
-		"""Returns and resets new task"""
-		new_task = self.new_task
-		self.new_task = None
-		return new_task
-
 class Explore(Task):
 	"""
 	Ant Exploring Task
 	"""
-	def __init__(self, ant):
-		super(Explore, self).__init__("explore", ant)
+	__slots__ = ()
+	id = EXPLORE
+	name = "explore"
+	fades_scent = True
+	transitions = (DROP_FOOD, FOLLOW_HOME_TRAIL, TAKE_FOOD, FOLLOW_FOOD_TRAIL)
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""
 		 If ant has food - 
 			 find home nearby and drop food there, else
@@ -89,65 +127,60 @@ class Explore(Task):
 		 	 reverse direction if it finds home nearby
 		 Reduce it scent strength by an unit
 		"""
-		ant = self.ant
 		if ant.has_food():
-			home_nearby = ant.locate_home_nearby()
+			if ant.locate_home_nearby() != None:
+				return DROP_FOOD
 			home_scent_nearby = ant.locate_home_scent_nearby()
-			if home_nearby != None:
-				self.new_task = "drop food"
-			elif home_scent_nearby != None:
+			if home_scent_nearby != None:
 				ant.turn(home_scent_nearby)
-				self.new_task = "follow home trail"
-			else:
-				ant.random_move()
+				return FOLLOW_HOME_TRAIL
+			ant.random_move()
+		elif ant.in_own_nest():
+			ant.move()
 		else:
 			food_nearby = ant.locate_food_nearby()
-			food_scent_nearby = ant.locate_food_scent_nearby()
-			if ant.here().is_own_home(ant.get_nest_id()):
-				ant.move()
-			elif food_nearby != None:
+			if food_nearby != None:
 				ant.turn(food_nearby)
-				self.new_task = "take food"
-			elif ant.ahead().is_own_home(ant.get_nest_id()):
-				ant.turn(choice([3, 4, 5]))
-				ant.home_scent_strength = 40
-			elif food_scent_nearby != None:
+				return TAKE_FOOD
+			elif ant.sensed_ahead(OWN_HOME):
+				ant.turn(ant.world.rng.choice([3, 4, 5]))
+				ant.home_scent_strength = ant.world.settings["scent_strength"]
+				return
+			food_scent_nearby = ant.locate_food_scent_nearby()
+			if food_scent_nearby != None:
 				ant.turn(food_scent_nearby)
-				self.new_task = "follow food trail"
-			else:
-				ant.random_move()
-		ant.reduce_food_scent_strength(1).reduce_home_scent_strength(1)
-		super(Explore, self).perform_task()
+				return FOLLOW_FOOD_TRAIL
+			ant.random_move()
 
 class TakeFood(Task):
 	"""
 	Gathers food from the cell
 	If food is present it takes the food otherwise it returns to explore mode
 	"""
-	def __init__(self, ant):
-		super(TakeFood, self).__init__("take food", ant)
+	__slots__ = ()
+	id = TAKE_FOOD
+	name = "take food"
+	transitions = (FOLLOW_HOME_TRAIL, EXPLORE)
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""
 		Take food if available otherwise return to explore mode
 		"""
-		ant = self.ant
 		food = ant.ahead().get_food(1)
 		if food:
 			ant.take_food(food)
 			ant.turn(4)
-			self.new_task = "follow home trail"
+			return FOLLOW_HOME_TRAIL
 		else:
-			self.new_task = "explore"
-		super(TakeFood, self).perform_task()
+			return EXPLORE
 
-	def end_task(self):
+	def end_task(self, ant):
 		"""
 		Increase food_scent_strength
 		and reduce home_scent_strength
 		"""
-		self.ant.set_food_scent_strength(40)
-		self.ant.set_home_scent_strength(0)
+		ant.set_food_scent_strength(ant.world.settings["scent_strength"])
+		ant.set_home_scent_strength(0)
 
 
 class DropFood(Task):
@@ -156,98 +189,109 @@ class DropFood(Task):
 	Randomly walks inside the nest and drops the food
 	and returns to explore mode
 	"""
-	def __init__(self, ant):
-		super(DropFood, self).__init__("drop food", ant)
+	__slots__ = ()
+	id = DROP_FOOD
+	name = "drop food"
+	transitions = (EXPLORE, FOLLOW_HOME_TRAIL)
 
-	def start_task(self):
-		self.ant.set_food_scent_strength(0)
-		self.ant.set_home_scent_strength(40)
+	def start_task(self, ant):
+		ant.set_food_scent_strength(0)
+		ant.set_home_scent_strength(ant.world.settings["scent_strength"])
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""
 		If ant reaches home drop the food inside the home
 		otherwise follow a home trail
 		"""
-		ant = self.ant
 		home_nearby = ant.locate_home_nearby()
 		if home_nearby !=None:
 			ant.turn(home_nearby)
 			ant.move()
-			if randint(1,10) == 1:
+			if ant.world.rng.randint(1,10) == 1:
 				ant.drop_food()
-				self.new_task = "explore"
+				return EXPLORE
 		else:
-			self.new_task = "follow home trail"
-		super(DropFood, self).perform_task()	
+			return FOLLOW_HOME_TRAIL
 
-	def end_task(self):
+	def end_task(self, ant):
 		"""
 		Increase home scent strength and reduce food scent strength
 		"""
-		self.ant.set_food_scent_strength(0)
-		self.ant.set_home_scent_strength(40)
+		ant.set_food_scent_strength(0)
+		ant.set_home_scent_strength(ant.world.settings["scent_strength"])
 
 class FollowFoodTrail(Task):
 	"""
 	Follows food trail if it finds a food scent nearby
 	"""
-	def __init__(self, ant):
-		super(FollowFoodTrail, self).__init__("follow food trail", ant)
+	__slots__ = ()
+	id = FOLLOW_FOOD_TRAIL
+	name = "follow food trail"
+	fades_scent = True
+	transitions = (TAKE_FOOD,)
 
-	def start_task(self):
+	def start_task(self, ant):
 		pass
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""
 		if food is found take food_scent_strength
 		otherwise rank cells based on scent and follow it
 		if scent trail is lost, return to explore mode
+		(with a navigation the ant goes down the food distance field
+		instead of ranking scents)
 		"""
-		ant = self.ant
 		food_nearby = ant.locate_food_nearby()
 		# food_scent_nearby = ant.locate_food_scent_nearby()
 		if food_nearby != None:
 			ant.turn(food_nearby)
-			self.new_task = "take food"
-		elif ant.ahead().is_obstacle() or ant.ahead().has_ant():
-			ant.turn(randint(1,3)-2)
-		elif ant.ahead().is_own_home(ant.get_nest_id()) and not ant.here().is_own_home(ant.get_nest_id()):
+			return TAKE_FOOD
+		elif ant.sensed_ahead(OBSTACLE) or ant.sensed_ahead(OCCUPIED):
+			ant.turn(ant.world.rng.randint(1,3)-2)
+		elif ant.sensed_ahead(OWN_HOME) and not ant.in_own_nest():
 			ant.turn(4)
-			ant.home_scent_strength = 40
+			ant.home_scent_strength = ant.world.settings["scent_strength"]
+		elif ant.world.navigation is not None:
+			ant.walk(ant.world.navigation.food_turn(ant))
 		else:
 			ant.turn(ant.rank_by_food_scent())
 			ant.move()
-		ant.reduce_home_scent_strength(1).reduce_food_scent_strength(1)
-		super(FollowFoodTrail, self).perform_task()
 
 class FollowHomeTrail(Task):
 	"""
 	Follows a home trail if it finds home scent 
 	"""
-	def __init__(self, ant):
-		super(FollowHomeTrail, self).__init__("follow home trail", ant)
+	__slots__ = ()
+	id = FOLLOW_HOME_TRAIL
+	name = "follow home trail"
+	fades_scent = True
+	transitions = (EXPLORE, DROP_FOOD)
 
-	def start_task(self):
+	def start_task(self, ant):
 		pass
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""
 			If home is reached drop the food_scent_strength
 			If trail is lost return to explore mode
 			else rank the cell by home scent strength and follow itself
+			(with a navigation go down the home distance field instead)
 		"""
-		ant = self.ant
-		home_nearby = ant.locate_home_nearby()
 		if not ant.has_food():
-			self.new_task = "explore"
-		elif ant.ahead().is_obstacle() or ant.ahead().has_ant():
-			ant.turn(choice([-1, 1]))
-		elif ant.ahead().is_food(ant.get_nest_id()):
+			return EXPLORE
+		elif ant.sensed_ahead(OBSTACLE) or ant.sensed_ahead(OCCUPIED):
+			ant.turn(ant.world.rng.choice([-1, 1]))
+			return
+		elif ant.sensed_ahead(FOOD):
 			ant.turn(4)
-			self.ant.food_scent_strength = 40
-		elif home_nearby != None:
+			ant.food_scent_strength = ant.world.settings["scent_strength"]
+			return
+		home_nearby = ant.locate_home_nearby()
+		if home_nearby != None:
 			ant.turn(home_nearby)
-			self.new_task = "drop food"
+			return DROP_FOOD
+		elif ant.world.navigation is not None:
+			ant.walk(ant.world.navigation.home_turn(ant))
 		else:
 			new_direction = ant.rank_by_home_scent()
 			if new_direction:
@@ -255,32 +299,35 @@ class FollowHomeTrail(Task):
 				ant.move()
 			else:
 				ant.random_move()
-		ant.reduce_food_scent_strength(1).reduce_home_scent_strength(1)
-		super(FollowHomeTrail, self).perform_task()
 
 class ReturnHome(Task):
 	"""
 	Return home if the ant is roaming outside
 	"""
-	def __init__(self, ant):
-		super(ReturnHome, self).__init__("return home", ant)		
+	__slots__ = ()
+	id = RETURN_HOME
+	name = "return home"
+	transitions = (GUARD_NEST,)
 
-	def start_task(self):
-		self.ant.set_home_scent_strength(0)
-		self.ant.set_food_scent_strength(0)
+	def start_task(self, ant):
+		ant.set_home_scent_strength(0)
+		ant.set_food_scent_strength(0)
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""
 		Follow home trail and return home
+		(with a navigation go down the home distance field instead)
 		"""
-		ant = self.ant
+		if ant.sensed_ahead(OBSTACLE) or ant.sensed_ahead(FOOD) or ant.sensed_ahead(OCCUPIED):
+			ant.turn(ant.world.rng.choice([-1, 1]))
+			return
 		home_nearby = ant.locate_home_nearby()
-		if ant.ahead().is_obstacle() or ant.ahead().is_food(ant.get_nest_id()) or ant.ahead().has_ant():
-			ant.turn(choice([-1, 1]))
-		elif home_nearby != None:
+		if home_nearby != None:
 			ant.turn(home_nearby)
 			ant.move()
-			self.new_task = "guard nest"
+			return GUARD_NEST
+		elif ant.world.navigation is not None:
+			ant.walk(ant.world.navigation.home_turn(ant))
 		else:
 			new_direction = ant.rank_by_home_scent()
 			if new_direction:
@@ -288,57 +335,66 @@ class ReturnHome(Task):
 				ant.move()
 			else:
 				ant.random_move()
-		super(ReturnHome, self).perform_task()
 
 class GuardNest(Task):
 	"""
 	Guards the nest
 	If it sees an enemy ant it attacks it
 	"""
-	def __init__(self, ant):
-		super(GuardNest, self).__init__("guard nest", ant)
-
-	def start_task(self):
-		self.ant.set_home_scent_strength(2)
-		self.ant.set_food_scent_strength(0)
-
-	def perform_task(self):
+	__slots__ = ()
+	id = GUARD_NEST
+	name = "guard nest"
+	## Looks for enemies in the spatial index of the world, which the
+	# tile workers do not keep up to date
+	local = False
+	transitions = (RETURN_HOME,)
+
+	def start_task(self, ant):
+		ant.set_home_scent_strength(2)
+		ant.set_food_scent_strength(0)
+
+	def perform_task(self, ant):
 		"""
 		Travel along the walls of the nest
 		"""
-		ant = self.ant
 		home_nearby = ant.locate_home_nearby()
 		enemy_ant_nearby = ant.get_enemy_ant_nearby()
 		if enemy_ant_nearby:
 			ant.attack(enemy_ant_nearby)
 		if not home_nearby:
-			self.new_task = "return home"
-		elif not ant.ahead().is_own_home(ant.get_nest_id()):
-			ant.turn(choice([-1, 1]))
+			return RETURN_HOME
+		elif not ant.sensed_ahead(OWN_HOME):
+			ant.turn(ant.world.rng.choice([-1, 1]))
 		else:
 			ant.move()
-		super(GuardNest, self).perform_task()
 
 class ProduceAnts(Task):
 	"""
 	Randomly produce new ants
 	"""
-	def __init__(self, ant):
-		super(ProduceAnts, self).__init__("produce ants", ant)
+	__slots__ = ()
+	id = PRODUCE_ANTS
+	name = "produce ants"
+	local = False
+	transitions = (FIND_FOOD,)
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""randomly produce new ants"""
-		if self.ant.is_hungry():
-			self.new_task = "have food"
-		elif randint(1,100) == 1:
-			self.ant.nest.add_new_ant_randomly()
-		super(ProduceAnts, self).perform_task()
+		if ant.is_hungry():
+			return FIND_FOOD
+		elif ant.world.rng.randint(1,100) == 1:
+			ant.nest.add_new_ant_randomly()
 		
 class FindFood(Task):
 	"""Finds food if hungry"""
-	def __init__(self, ant):
-		super(FindFood, self).__init__("find food", ant)
+	__slots__ = ()
+	id = FIND_FOOD
+	name = "find food"
+	local = False
 
-	def perform_task(self):
+	def perform_task(self, ant):
 		"""find food"""
-		super(FindFood, self).perform_task()
+
+## The shared instance of every task, indexed by task id
+TASKS = [Explore(), TakeFood(), DropFood(), FollowFoodTrail(), FollowHomeTrail(),
+	ReturnHome(), GuardNest(), ProduceAnts(), FindFood()]
@@ -1,27 +1,70 @@
 from ants import WorkerAnt, SoldierAnt, QueenAnt
-from random import randint, choice
-from pygame import display, Surface
+from pygame import display, Surface, Rect
 from display import Entity
-from constants import GREEN, DIRECTIONS, YELLOW
+from constants import GREEN, DIRECTIONS, YELLOW, SCENT_FADE, FULL_REDRAW_SHARE
+from task_manager import TASKS
+from scent import ScentField, LazyScentField, make_tiles, tile_pool
+from overlay import ScentOverlay, OVERLAY_MODES
+from frame import Frame
+from population import Population
+from profiler import Profiler
 from math import sqrt
+from collections import OrderedDict
+from rng import make_rng
+from lifecycle import Lifecycle
+from chunks import CellStore
+from navigation import Navigation
+from sensing import Senses
+from spatial import SpatialIndex
+from stepping import TiledStepper
+from timeit import default_timer
+import numpy
+
+## The x and y steps of the DIRECTIONS
+DX, DY = numpy.array(DIRECTIONS).T
+
+class GridField(object):
+	"""
+	Attribute of a cell stored in a flat grid array of the World
+	"""
+	def __init__(self, name):
+		self.name = name
+
+	def __get__(self, cell, owner=None):
+		if cell is None:
+			return self
+		return getattr(cell.world, self.name).item(cell.index)
+
+	def __set__(self, cell, value):
+		getattr(cell.world, self.name)[cell.index] = value
 
 class Cell(Entity):
 	"""
 	Data containers for each location in World
+	The obstacle, food and home of a cell live in the grids of the world,
+	so that they can be read for many cells at once (see sensing.py)
 	"""
+	__slots__ = ("index", "neighbours")
+	obstacle = GridField("obstacle_grid")
+	food = GridField("food_grid")
+	home = GridField("home_grid")
+
 	def __init__(self, world, i, j):
-		self.obstacle = False
-		self.food = 0
-		self.home_scent = {}
-		self.food_scent = {}
-		self.ant = None
-		self.home = -1
-		super(Cell, self).__init__(world, (i, j), (1,1), world.images["cell"])
+		self.index = world.index((i, j))
+		self.neighbours = None
+		super(Cell, self).__init__(world, (i, j), (1,1), world.images.get("cell"))
 
 	## Adds food to the cell
 	# @param amt The amount of food to be added
+	# (food added to a home cell is stored by its nest)
 	def add_food(self, amt):
+		had_food = self.food > 0
 		self.food += amt
+		if self.home != -1:
+			self.world.nests[self.home].food += amt
+		self.world.mark_dirty(self.location)
+		if not had_food and self.food > 0 and self.world.navigation is not None:
+			self.world.navigation.food_added(self)
 		return self
 
 	## Adds home scent to the cell
@@ -31,42 +74,40 @@ class Cell(Entity):
 		"""
 		adds home scent for the particular ant colony (depending on the id)
 		"""
-		if not id in self.home_scent:
-			self.home_scent[id] = 0
-		if not self.is_obstacle():
-			self.home_scent[id] += amt
-		else:
-			self.home_scent[id] = 0
+		x, y = self.location
+		self.world.scent.add_home_scent(x, y, amt, id)
 		return self
 
 	## Adds food scent to the cell
 	# @param amt The amount of scent to add
 	# @param id The id of the nest the ant belongs to
 	def add_food_scent(self, amt, id):
-		if not id in self.food_scent:
-			self.food_scent[id] = 0
-		if not self.is_obstacle():
-			self.food_scent[id] += amt
-		else:
-			self.food_scent[id] = 0
+		x, y = self.location
+		self.world.scent.add_food_scent(x, y, amt, id)
 		return self
 
 	## Gets food from the cell
 	# @param amt The amount of food taken
 	# Returns an amount of food if available
 	def get_food(self, amt):
+		self.world.mark_dirty(self.location)
 		if self.food < amt:
 			food = self.food
 			self.food = 0
-			return food
 		else:
+			food = amt
 			self.food -= amt
-			return amt
+		if self.home != -1:
+			self.world.nests[self.home].food -= food
+		if food and not self.food and self.world.navigation is not None:
+			self.world.navigation.food_removed(self)
+		return food
 
 	## Get the amount of food scent in the cell
 	# @param id The id of the nest the ant belongs to
 	def get_food_scent(self, id):
-		return self.food_scent[id] if id in self.food_scent else 0
+		x, y = self.location
+		return self.world.scent.get_food_scent(x, y, id)
 
 	## Get the amount of home scent in the cell
 	# @param id The id of the nest the ant belongs to
@@ -74,7 +115,8 @@ class Cell(Entity):
 		"""
 		get home scent for the colony given by id
 		"""
-		return self.home_scent[id] if id in self.home_scent else 0
+		x, y = self.location
+		return self.world.scent.get_home_scent(x, y, id)
 
 	def is_obstacle(self):
 		"""
@@ -104,11 +146,18 @@ class Cell(Entity):
 	def is_food(self, id):
 		return bool(self.food) and not self.is_own_home(id)
 
+	@property
+	def ant(self):
+		"""
+		The ant on the cell (None if empty), looked up in the occupancy grid
+		"""
+		return self.world.occupant(self.index)
+
 	def has_ant(self):
 		"""
 		Check if the particular cell has an ant
 		"""
-		return bool(self.ant)
+		return self.world.occupancy.item(self.index) != -1
 
 	def has_food(self):
 		"""
@@ -119,7 +168,12 @@ class Cell(Entity):
 	## Convert the cell into a home cell
 	# @param id The id of the nest
 	def make_home(self, id):
+		if self.home in self.world.nests:
+			self.world.nests[self.home].food -= self.food
 		self.home = id
+		self.world.mark_dirty(self.location)
+		if self.world.navigation is not None:
+			self.world.navigation.reset()
 		return self
 
 	def make_obstacle(self):
@@ -128,10 +182,11 @@ class Cell(Entity):
 		"""
 		if not self.is_home() and not self.has_ant() and not self.has_food():
 			self.obstacle = True
-			for id in self.food_scent:
-				self.food_scent[id] = 0
-			for id in self.home_scent:
-				self.home_scent[id] = 0
+			x, y = self.location
+			self.world.scent.block(x, y)
+			self.world.mark_dirty(self.location)
+			if self.world.navigation is not None:
+				self.world.navigation.block(self.index)
 		return self
 
 	def remove_obstacle(self):
@@ -139,75 +194,61 @@ class Cell(Entity):
 		Removes obstacle from the cell
 		"""
 		self.obstacle = False
+		x, y = self.location
+		self.world.scent.unblock(x, y)
+		self.world.mark_dirty(self.location)
+		if self.world.navigation is not None:
+			self.world.navigation.unblock(self.index)
 		return self
 
 	## Evaporates the scent
 	# @param rate The rate at which evporation happens
 	# Follows the decay law
 	def evaporate_scent(self, rate):
-		for id in self.food_scent:
-			food_scent_delta = self.food_scent[id] * rate
-			self.food_scent[id] -= food_scent_delta
-			if self.food_scent < .3:
-				self.food_scent[id] = 0
-		for id in self.home_scent:
-			home_scent_delta = self.home_scent[id] * rate
-			self.home_scent[id] -= home_scent_delta
-			if self.home_scent[id] < .3:
-				self.home_scent[id] = 0
+		x, y = self.location
+		self.world.scent.evaporate_cell(x, y, rate)
 		return self
 
 	def nearby(self):
 		"""
-		Returns all nearby 8 cells
+		Returns all nearby 8 cells (in the order of DIRECTIONS)
+		The list is looked up the first time, it is shared and must not
+		be modified
 		"""
-		x, y = self.location
-		cells = []
-		for dx, dy in DIRECTIONS:
-			X, Y = (x+dx)%self.world.width, (y+dy)%self.world.height
-			cells.append(self.world[(X, Y)])
-		return cells
+		if self.neighbours is None:
+			cells = self.world.cells
+			self.neighbours = [cells[index] for index in self.world.neighbours_of(self.index)]
+		return self.neighbours
 
 	def get_max_home_scent(self):
 		"""
 		Get the maximum home scent values amongst
 		the scents of all colonies
 		"""
-		scent = self.home_scent.values()
-		return max(scent) if scent else 0
+		x, y = self.location
+		return self.world.scent.get_max_home_scent(x, y)
 
 	def get_max_food_scent(self):
 		"""
 		Get the maximum food scent values amongst
 		the scents of all colonies
 		"""
-		scent = self.food_scent.values()
-		return max(scent) if scent else 0
+		x, y = self.location
+		return self.world.scent.get_max_food_scent(x, y)
 
 	def render(self):
 		"""
 		Extends the base class method
 		Changes "index" to render the cell according to what it represents 
 		(home, food, etc) and calls the super class
-		Also renders scent levels with transparency depending on its strength
+		Scent is drawn separately by the world's ScentOverlay
 		"""
-		self.image.set_alpha(255)
 		if self.has_food():
 			super(Cell, self).render(3)
 		elif self.is_obstacle():
 			super(Cell, self).render(2)
 		elif self.has_food():
 			super(Cell, self).render(4)
-
-		max_home_scent = self.get_max_home_scent()
-		if max_home_scent > 0:
-			self.image.set_alpha(max_home_scent)
-			super(Cell, self).render(4)
-		
-		max_food_scent = self.get_max_food_scent()
-		if any(self.food_scent.values()):
-			self.image.set_alpha(max_food_scent)
-			super(Cell, self).render(5)
 		return self
 
 class Nest(Entity):
@@ -219,6 +260,7 @@ class Nest(Entity):
 		self.size = size
 		self.world = world
 		self.ant_count = ant_count
+		self.food = 0
 		super(Nest, self).__init__(world, location, size, None)
 		self.spawn_ants()
 		self.mark_home()
@@ -232,9 +274,19 @@ class Nest(Entity):
 		self.image.fill(YELLOW)
 		self.image.set_alpha(196)
 
+	## Draws the part of the nest covering a single cell
+	# @param location The location of the cell
+	def render_cell(self, location):
+		x, y = location
+		nx, ny = self.location
+		size = self.world.cell_size
+		patch_rect = ((x-nx)*size, (y-ny)*size, size, size)
+		self.world.canvas.blit(self.image, (x*size, y*size), patch_rect)
+
 	def mark_home(self):
 		"""
 		Converts the cell at its location to its nest
+		and stores the food already on them
 		"""
 		width, height = self.size
 		# width /= self.world.settings["cell_size"]
@@ -243,6 +295,7 @@ class Nest(Entity):
 		for i in range(width):
 			for j in range(height):
 				self.world[(x+i,y+j)].make_home(self.id)
+				self.food += self.world[(x+i,y+j)].food
 
 	def spawn_ants(self):
 		"""
@@ -255,13 +308,13 @@ class Nest(Entity):
 	def add_new_ant(self, ant_type):
 		x, y = self.location
 		width, height = self.size
-		direction = randint(1,8)
-		location = x+randint(0,width/self.world.settings["cell_size"]), y+randint(0,height/self.world.settings["cell_size"])
-		new_ant = ant_type(self.world, self.world.images["ant"], direction, location, self)
+		direction = self.world.rng.randint(1,8)
+		location = x+self.world.rng.randint(0,width/self.world.settings["cell_size"]), y+self.world.rng.randint(0,height/self.world.settings["cell_size"])
+		new_ant = self.world.ant_class(ant_type)(self.world, self.world.images.get("ant"), direction, location, self)
 		self.world.add_ant(new_ant)
 
 	def add_new_ant_randomly(self):
-		num = randint(1,100)
+		num = self.world.rng.randint(1,100)
 		if num<90:
 			ant = WorkerAnt
 		elif num<98:
@@ -276,80 +329,287 @@ class World():
 	"""
 	Encapsulation of all objects in the simulation
 	"""
-	def __init__(self, width, height, images, settings):
+	def __init__(self, width, height, images, settings, generate=True):
 		"""
-		- Initialise the screen
-		- Fill screen with "Cells"
+		- Initialise the screen (or an offscreen surface, or nothing at all
+		  when the "render_mode" setting is "offscreen" or "none")
+		- Fill screen with "Cells" (created chunk by chunk when first
+		  used, see CellStore)
 		- Convert images to pygame format
 		- Spawn ants, food sources, obstacles, ant home, etc
+		  (unless "generate" is False, to fill the world from a snapshot)
+		All randomness goes through self.rng, seeded from the settings
 		"""
 		self.settings = settings
 		self.width = width
 		self.height = height
 		self.cell_size = settings["cell_size"]
 		self.images = images
+		self.rng = make_rng(settings)
 
-		self.canvas = display.set_mode((self.width*self.cell_size, self.height*self.cell_size))
+		self.canvas = self.create_canvas()
 		self.convert_images()
 
-		self.cells = [[Cell(self, i, j) for j in xrange(height)] for i in xrange(width)]
-
-		self.counter = 0
-
+		self.dirty = set()
+		self.full_redraw = True
+		self.overlay = ScentOverlay(self)
+
+		self.scent = self.create_scent()
+		self.create_tiles()
+		self.cells = CellStore(width, height, settings["chunk_size"], lambda i, j: Cell(self, i, j))
+		self.occupancy = numpy.full(width*height, -1, numpy.int64)
+		self.obstacle_grid = numpy.zeros(width*height, bool)
+		self.food_grid = numpy.zeros(width*height, numpy.float64)
+		self.home_grid = numpy.full(width*height, -1, numpy.int32)
+		self.senses = None
+
+		self.lifecycle = Lifecycle(self)
+		self.spatial = SpatialIndex(self, settings["region_size"])
+		self.lifecycle.add_listener(self.spatial)
+		self.population = Population(lifecycle=self.lifecycle) if settings["population"] == "arrays" else None
+		self.stepper = TiledStepper(self, settings["step_tiles"]) if self.population is not None and settings["step_tiles"] > 1 else None
+		self.profiler = Profiler(settings["profile_report_every"]) if settings["profile"] else None
+		self.recorder = None
+		self.metrics = None
+		self.navigation = Navigation(self) if settings["navigation"] else None
 		self.ants = {}
 		self.nests = {}
+		if not generate:
+			return
 		# self.spawn_worker_ants()
 		# self.spawn_soldier_ants()
 		self.create_walls()
 		for i in xrange(4):
 			self.spawn_foodsource()
 		# self.create_home()
-		self.spawn_colonies(2)
+		self.spawn_colonies(settings["no_of_nests"])
 
 	def __getitem__(self, location):
 		"""
 		Returns the cell at the location
 		"""
+		return self.cells[self.index(location)]
+
+	## Returns the flat index of a location (the index of its cell in cells)
+	# @param location The location, wrapped around the edges of the world
+	def index(self, location):
 		x, y = location
-		return self.cells[x%self.width][y%self.height]
+		return (x%self.width)*self.height + y%self.height
+
+	## Returns the flat indices of the 8 neighbours of cells, in the order
+	# of DIRECTIONS (the grid wraps around), one row per cell
+	# Turning relative to a direction is (direction + turn)%8
+	# @param indices An array of flat indices
+	def neighbours(self, indices):
+		xs, ys = numpy.divmod(numpy.asarray(indices)[..., None], self.height)
+		return (xs + DX)%self.width*self.height + (ys + DY)%self.height
+
+	## Returns the list of the flat indices of the 8 neighbours of a cell
+	# (see neighbours)
+	# @param index The flat index of the cell
+	def neighbours_of(self, index):
+		width, height = self.width, self.height
+		x, y = divmod(index, height)
+		return [(x + dx)%width*height + (y + dy)%height for dx, dy in DIRECTIONS]
+
+	def create_scent(self):
+		"""
+		Creates the scent field depending on the "scent_decay" setting
+			- eager : all scent evaporates every tick
+			- lazy : scent evaporates when it is used (see LazyScentField)
+		"""
+		if self.settings["scent_decay"] == "lazy":
+			return LazyScentField(self.settings["no_of_nests"], self.width, self.height, self.settings["scent_compact_every"])
+		return ScentField(self.settings["no_of_nests"], self.width, self.height)
+
+	def create_tiles(self):
+		"""
+		Splits the scent field into the number of tiles given by the
+		"tiles" setting, evaporated in parallel by a pool of threads
+		shared with the other worlds (a single tile is evaporated in one
+		pass, without a pool, lazy scent is never tiled)
+		"""
+		kernel = self.settings["diffusion_kernel"]
+		halo = len(kernel)/2 if kernel is not None else 0
+		tiles = self.settings["tiles"] if self.settings["scent_decay"] == "eager" else 1
+		self.tiles = make_tiles(self.width, tiles, halo)
+		self.tile_pool = tile_pool(len(self.tiles)) if len(self.tiles) > 1 else None
+
+	## Returns the ant on a cell, None if the cell is empty
+	# @param index The flat index of the cell
+	def occupant(self, index):
+		id = self.occupancy.item(index)
+		return self.ants[id] if id != -1 else None
+
+	def create_canvas(self):
+		"""
+		Creates the surface the world is drawn on
+		depending on the "render_mode" setting
+			- display : the screen
+			- offscreen : a surface that is never shown
+			- none : no surface, rendering is skipped
+		"""
+		size = (self.width*self.cell_size, self.height*self.cell_size)
+		mode = self.settings["render_mode"]
+		if mode == "display":
+			return display.set_mode(size)
+		elif mode == "offscreen":
+			return Surface(size)
+		return None
+
+	## Marks a cell to be redrawn in the next frame
+	# @param location The location of the cell
+	# (and tells the recorder, if one is attached, that the cell may have changed)
+	def mark_dirty(self, location):
+		if self.canvas is not None:
+			self.dirty.add(location)
+		if self.recorder is not None:
+			self.recorder.touch(location)
+
+	## Returns the class used to create ants of a type
+	# (a proxy over the population when it is stored in arrays)
+	# @param ant_type The Ant subclass
+	def ant_class(self, ant_type):
+		if self.population is None:
+			return ant_type
+		return self.population.proxy_class(ant_type)
+
+	## Changes how scent is drawn and redraws the whole world
+	# @param mode One of OVERLAY_MODES
+	def set_scent_overlay(self, mode):
+		self.settings["scent_overlay"] = mode
+		self.full_redraw = True
+
+	def toggle_scent_overlay(self):
+		"""
+		Switches to the next scent overlay mode
+		"""
+		index = OVERLAY_MODES.index(self.settings["scent_overlay"])
+		self.set_scent_overlay(OVERLAY_MODES[(index + 1) % len(OVERLAY_MODES)])
 
 	def convert_images(self):
 		"""
 		Convert images to pygame optimised format
+		(only possible once the screen is initialised)
 		"""
+		if self.settings["render_mode"] != "display":
+			return
 		for name in self.images:
 			self.images[name] = self.images[name].convert()
 
 	def advance(self):
 		"""
 		Advance the simulation by one step
-			- Update te ants
+			- Sense the surroundings of all ants at once
+			- Update te ants (task by task when the population is
+			  stored in arrays)
 			- Evaporate all scents
+		Every phase is recorded when a profiler is attached, the
+		changes of the tick when a recorder is attached and the
+		metrics when metrics are attached
 		"""
-		for ant in self.ants.values():
-			ant.task_manager.make_decision()
+		if self.profiler is not None:
+			self.profiler.advance(self)
+		else:
+			self.sense_ants()
+			if self.population is not None:
+				self.step_population()
+			else:
+				self.step_ants()
+
+			self.evaporate_scent()
+			self.remove_dead_ants()
+
+		if self.recorder is not None:
+			self.recorder.record_tick()
+		if self.metrics is not None:
+			self.metrics.record_tick()
+		return self
+
+	## Reads what every ant senses around it from the grids, in one pass
+	# (see sensing.py), the ants find their row in World.senses through
+	# their "sense" attribute
+	def sense_ants(self):
+		population = self.population
+		if population is not None:
+			size = population.size
+			self.senses = Senses(self, population.index[:size], population.nest[:size])
+		else:
+			ants = self.ants.values()
+			for row, ant in enumerate(ants):
+				ant.sense = row
+			self.senses = Senses(self, [ant.index for ant in ants], [ant.get_nest_id() for ant in ants])
+		return self
 
-		self.evaporate_scent()
-		self.remove_dead_ants()
+	## Advances all ants stored in the population by one step, tile by
+	# tile on worker processes with the "step_tiles" setting (see
+	# stepping.py, the ants stored as objects are never tiled)
+	# @param profiler Optional Profiler recording every task
+	def step_population(self, profiler=None):
+		if self.stepper is not None:
+			self.stepper.step(profiler)
+		else:
+			self.population.step(profiler)
+		return self
+
+	## Advances all ants (stored as objects) by one step
+	#	- every ant performs its active task
+	#	- the costs of the tasks are applied to all ants at once
+	#	- ants whose task asked for a new one switch to it
+	# Ants born during the step only act from the next step on
+	# @param profiler Optional Profiler recording every task
+	def step_ants(self, profiler=None):
+		ants = self.ants.values()
+		switches = []
+		for ant in ants:
+			task = ant.task_manager.active_task
+			if profiler is not None:
+				start = default_timer()
+			new_task = task.perform_task(ant)
+			if profiler is not None:
+				profiler.record_task(task.name, default_timer() - start)
+			if new_task is not None:
+				switches.append((ant, new_task))
+
+		self.apply_task_costs(ants)
+
+		for ant, new_task in switches:
+			if profiler is not None:
+				profiler.record_transition(ant.task_manager.active_task.name, TASKS[new_task].name)
+			ant.task_manager.switch_task(new_task)
+		return self
+
+	## Applies the costs of their active task to ants: the health lost and
+	# the fading of the scent strengths (see Task)
+	# @param ants The ants
+	def apply_task_costs(self, ants):
+		for ant in ants:
+			task = ant.task_manager.active_task
+			if task.fades_scent:
+				ant.food_scent_strength *= SCENT_FADE
+				ant.home_scent_strength *= SCENT_FADE
+			ant.reduce_health(task.health_cost)
 		return self
 
 	def add_ant(self, ant):
 		"""
 		add a new ant into the world
 		"""
-		self.ants[self.counter] = ant
-		self[ant.get_location()].ant = ant
-		self.counter += 1
+		ant.id = self.lifecycle.allocate_id()
+		self.ants[ant.id] = ant
+		self.occupancy[ant.index] = ant.id
+		self.mark_dirty(ant.get_location())
+		self.lifecycle.born(ant)
 
 	def spawn_foodsource(self):
 		"""
 		Spawns food sources
 		"""
-		x, y = randint(0,self.width-1), randint(0,self.height-1)
-		for i in xrange(randint(2000, 5000)):
-			dx = randint(-3,3)
-			dy = choice([-1,1])*randint(0, int(sqrt(9-dx**2)))
-			self.cells[(x+dx)%self.width][(y+dy)%self.height].add_food(1)
+		x, y = self.rng.randint(0,self.width-1), self.rng.randint(0,self.height-1)
+		for i in xrange(self.rng.randint(2000, 5000)):
+			dx = self.rng.randint(-3,3)
+			dy = self.rng.choice([-1,1])*self.rng.randint(0, int(sqrt(9-dx**2)))
+			self[(x+dx, y+dy)].add_food(1)
 
 	def spawn_colonies(self, n=1):
 		"""
@@ -358,8 +618,8 @@ class World():
 		for i in xrange(n):
 			size = [self.settings["home_size"]]*2
 			location = (
-				randint(0, self.width - self.settings["home_size"]),
-				randint(0, self.height - self.settings["home_size"])
+				self.rng.randint(0, self.width - self.settings["home_size"]),
+				self.rng.randint(0, self.height - self.settings["home_size"])
 				)
 			nest = Nest(self, i, size, location, self.get_ant_count())
 			self.nests[i] = nest
@@ -367,12 +627,15 @@ class World():
 	def get_ant_count(self):
 		"""
 		Returns a list of no. of different types of ants
+		(ordered, so that seeded runs spawn the ants in the same order)
+		The "ant_mix" setting gives the workers, soldiers and queens
 		"""
-		return { 
-			WorkerAnt: 94,
-			SoldierAnt: 5,
-			QueenAnt: 1
-		}
+		workers, soldiers, queens = self.settings["ant_mix"]
+		return OrderedDict([
+			(WorkerAnt, workers),
+			(SoldierAnt, soldiers),
+			(QueenAnt, queens)
+		])
 
 	def create_walls(self):
 		"""
@@ -387,40 +650,119 @@ class World():
 			self[(0, j)].make_obstacle()
 			self[(self.width-1, j)].make_obstacle()
 
-	def render(self):
-		"""
-		Draws the world and all its entities on the screen
-		"""
-		self.canvas.fill(GREEN)
+	## Draws the world and all its entities on the screen
+	# Does nothing when there is no canvas (headless mode)
+	# The first frame is drawn completely, afterwards only the cells
+	# marked dirty and the cells whose visible scent level changed
+	# are redrawn and updated on the screen (the whole world again when
+	# they are more than FULL_REDRAW_SHARE of it)
+	# @param frame The Frame to draw, taken from the world now if None
+	# (a frame taken earlier can be drawn while the world advances)
+	def render(self, frame=None):
+		if self.canvas is None:
+			return self
+		if self.profiler is not None:
+			return self.profiler.phase("render", lambda: self.render_frame(frame))
+		return self.render_frame(frame)
+
+	def capture(self):
+		"""
+		Returns a Frame with what the next render needs, and starts
+		collecting the dirty cells of the frame after it
+		"""
+		return Frame(self)
+
+	## Draws a frame on the canvas (see render)
+	# @param frame The Frame, taken from the world now if None
+	def render_frame(self, frame=None):
+		if frame is None:
+			frame = self.capture()
+		scent_changes = self.overlay.update(frame)
+		dirty = frame.dirty
+		if scent_changes is not None:
+			dirty.update(scent_changes)
+		if frame.full or len(dirty) > FULL_REDRAW_SHARE*self.width*self.height:
+			rects = [self.render_all(frame)]
+		else:
+			rects = [self.render_cell(frame, location) for location in dirty]
+			for image, location, patch in frame.ants:
+				if location in dirty:
+					self.render_patch(image, location, patch)
 
-		for cells in self.cells:
-			for cell in cells:
-				cell.render()
+		if self.settings["render_mode"] == "display":
+			display.update(rects)
+		return self
 
-		for nest in self.nests.values():
-			nest.render()
+	## Draws every cell, nest and ant of a frame
+	# (only the cells with food or an obstacle are drawn, the others are
+	# grass, already filled in, and a nest overlapped by another one is
+	# only drawn on the cells it owns, like render_cell does)
+	# @param frame The Frame
+	# Returns the rect covering the whole world
+	def render_all(self, frame):
+		self.canvas.fill(GREEN)
 
-		for ant in self.ants.values():
-			ant.render()
+		for index in numpy.flatnonzero((frame.food_grid > 0) | frame.obstacle_grid).tolist():
+			self.render_patch(self.images.get("cell"), divmod(index, self.height), 3 if frame.food_grid.item(index) > 0 else 2)
 
-		display.update((0, 0), (self.width*self.cell_size, self.height*self.cell_size))
-		return self
+		self.overlay.render()
+
+		owned = numpy.bincount(frame.home_grid[frame.home_grid != -1], minlength=len(self.nests))
+		for nest in self.nests.values():
+			width, height = nest.size
+			if owned[nest.id] == width*height:
+				nest.render()
+			else:
+				for index in numpy.flatnonzero(frame.home_grid == nest.id).tolist():
+					nest.render_cell(divmod(index, self.height))
+
+		for image, location, patch in frame.ants:
+			self.render_patch(image, location, patch)
+
+		return Rect(0, 0, self.width*self.cell_size, self.height*self.cell_size)
+
+	## Redraws a single cell of a frame with the nest on it (ants are
+	# drawn afterwards)
+	# @param frame The Frame
+	# @param location The location of the cell
+	# Returns the rect of the cell on the screen
+	def render_cell(self, frame, location):
+		x, y = location = location[0]%self.width, location[1]%self.height
+		rect = Rect(x*self.cell_size, y*self.cell_size, self.cell_size, self.cell_size)
+		self.canvas.fill(GREEN, rect)
+		index = self.index(location)
+		food = frame.food_grid.item(index) > 0
+		if food or frame.obstacle_grid.item(index):
+			self.render_patch(self.images.get("cell"), location, 3 if food else 2)
+		self.overlay.render_cell(location)
+		home = frame.home_grid.item(index)
+		if home != -1:
+			self.nests[home].render_cell(location)
+		return rect
+
+	## Draws a part of an image over a cell (like Entity.render)
+	# @param image The image, its parts side by side
+	# @param location The location of the cell
+	# @param patch The index of the part
+	def render_patch(self, image, location, patch):
+		x, y = location
+		size = self.cell_size
+		self.canvas.blit(image, (x*size, y*size), (patch*size, 0, size, size))
 
 	def evaporate_scent(self):
 		"""
 		Evaporates all scent ( uses decay law ) at a rate defined in settings
+		and spreads it with the diffusion kernel if one is set
 		"""
-		for cells in self.cells:
-			for cell in cells:
-				cell.evaporate_scent(self.settings["evaporation_rate"])
+		if self.tile_pool is not None:
+			self.scent.evaporate_tiles(self.settings["evaporation_rate"], self.settings["diffusion_kernel"], self.tiles, self.tile_pool)
+		else:
+			self.scent.evaporate(self.settings["evaporation_rate"], self.settings["diffusion_kernel"])
 		return self
 
 	def remove_dead_ants(self):
-		dead_ant_ids = []
-		for id in self.ants:
-			ant = self.ants[id]
-			if ant.is_dead():
-				dead_ant_ids.append(id)
-		for id in dead_ant_ids:
-			print "An ant from nest #%d is dead"%self.ants[id].get_nest_id()
-			del self.ants[id]
\ No newline at end of file
+		"""
+		Removes the ants that died during the tick (see Lifecycle)
+		"""
+		self.lifecycle.remove_dead()
+		return self
\ No newline at end of file